@@ -1,20 +1,19 @@
 import os
 
-import boto3
 import z2jh
 
+from oslhub.secret_refresher import SecretRefresher
+
 # This try/except is needed for debugging if a problem occurs. AWS Codebuild doesn't allow for useful error messaging.
 try:
     ## Set SSO token to secrets path
-    secrets_manager = boto3.client(
-        "secretsmanager", region_name=f"{z2jh.get_config('custom.AWS_REGION')}"
-    )
-    _sso_token = secrets_manager.get_secret_value(
-        SecretId=f"sso-token/{z2jh.get_config('custom.AWS_REGION')}-{z2jh.get_config('custom.CLUSTER_NAME')}"
+    # Fetched at every hub start and refreshed in the background, so a rotated token is picked up
+    sso_token_refresher = SecretRefresher(
+        secret_id=f"sso-token/{z2jh.get_config('custom.AWS_REGION')}-{z2jh.get_config('custom.CLUSTER_NAME')}",
+        region_name=f"{z2jh.get_config('custom.AWS_REGION')}",
+        path=os.environ.get("OPENSARLAB_SSO_TOKEN_PATH", ""),
     )
-    sso_token_path = os.environ.get("OPENSARLAB_SSO_TOKEN_PATH", "")
-    with open(sso_token_path, "w") as file:
-        file.write(_sso_token["SecretString"])
+    sso_token_refresher.start()
 
     # If an error occurs with setting the auth but JupyterHub still starts, the dummy login will be the default.
     # This could lead to unauthorized entry. So disable login until the last needed moment.
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
-import boto3
 import datetime
 
+import botocore.exceptions
+
 import logging
 
 logging.basicConfig(
@@ -12,6 +13,25 @@ log = logging.getLogger(__name__)
 
 import z2jh
 
+from oslhub.clients import get_aws_client
+from oslhub.executor import run_blocking
+from oslhub.stop_tags import StopTagQueue
+from oslhub.storage_cache import VOLUMES, get_storage_cache
+from oslhub.timing import PhaseTimer
+
+storage_cache = get_storage_cache(ttl=z2jh.get_config("custom.STORAGE_CACHE_TTL", 600))
+
+# Queue stop tags and send them in batches from a thread instead of tagging on the hub's event loop
+stop_tag_queue = None
+if z2jh.get_config("custom.STOP_TAG_FLUSH_SECONDS", 0):
+    stop_tag_queue = StopTagQueue(
+        region_name=z2jh.get_config("custom.AWS_REGION"),
+        cluster_name=z2jh.get_config("custom.CLUSTER_NAME"),
+        path=z2jh.get_config("custom.STOP_TAG_QUEUE_FILE", None),
+        interval=z2jh.get_config("custom.STOP_TAG_FLUSH_SECONDS"),
+    )
+    stop_tag_queue.start()
+
 
 def _get_delta_time(days: int) -> datetime:
     """
@@ -25,7 +45,7 @@ def _get_delta_time(days: int) -> datetime:
     return the_future_in_utc.replace(second=0, microsecond=0)
 
 
-def server_stopping_tags(spawner):
+async def server_stopping_tags(spawner, timer: PhaseTimer):
     pvc_name = spawner.pvc_name
     cluster_name = z2jh.get_config("custom.CLUSTER_NAME")
     region_name = z2jh.get_config("custom.AWS_REGION")
@@ -33,22 +53,73 @@ def server_stopping_tags(spawner):
     days_till_volume_deletion = z2jh.get_config("custom.DAYS_TILL_VOLUME_DELETION")
     days_till_snapshot_deletion = z2jh.get_config("custom.DAYS_TILL_SNAPSHOT_DELETION")
 
-    session = boto3.Session(region_name=region_name)
-    ec2 = session.client("ec2")
-
     log.info(f"Updating stopping tags to '{pvc_name}' in cluster '{cluster_name}'...")
 
-    vol = ec2.describe_volumes(
-        Filters=[
-            {"Name": "tag:kubernetes.io/created-for/pvc/name", "Values": [pvc_name]},
-            {
-                "Name": "tag:kubernetes.io/cluster/{0}".format(cluster_name),
-                "Values": ["owned"],
-            },
-        ]
-    )
-
-    vol = vol["Volumes"]
+    tags = [
+        {
+            "Key": "server-stop-time",
+            "Value": "{0}".format(_get_delta_time(days=0)),
+        },
+        {
+            "Key": "volume-delete-time",
+            "Value": "{0}".format(_get_delta_time(days=days_till_volume_deletion)),
+        },
+        {
+            "Key": "snapshot-delete-time",
+            "Value": "{0}".format(_get_delta_time(days=days_till_snapshot_deletion)),
+        },
+    ]
+
+    if stop_tag_queue is not None:
+        # The flusher looks the volume up by PVC name if its ID isn't known here
+        vol_id = spawner.volume_id or None
+        if vol_id is None:
+            vol = storage_cache.get(VOLUMES, pvc_name)
+            if vol is not None and len(vol) == 1:
+                vol_id = vol[0]["VolumeId"]
+        stop_tag_queue.put(pvc_name, tags, vol_id=vol_id)
+        storage_cache.invalidate(pvc_name, VOLUMES)
+        return
+
+    ec2 = await run_blocking(get_aws_client, "ec2", region_name)
+
+    if spawner.volume_id:
+        try:
+            with timer.phase("stop_tag"):
+                await run_blocking(
+                    ec2.create_tags,
+                    DryRun=False,
+                    Resources=[spawner.volume_id],
+                    Tags=tags,
+                )
+            storage_cache.invalidate(pvc_name, VOLUMES)
+            return
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidVolume.NotFound":
+                raise
+            log.warning(
+                f"Remembered volume {spawner.volume_id} no longer exists. Searching for the volume of '{pvc_name}'..."
+            )
+            spawner.volume_id = ""
+
+    vol = storage_cache.get(VOLUMES, pvc_name)
+    if vol is None:
+        with timer.phase("volume_lookup"):
+            vol = await run_blocking(
+                ec2.describe_volumes,
+                Filters=[
+                    {
+                        "Name": "tag:kubernetes.io/created-for/pvc/name",
+                        "Values": [pvc_name],
+                    },
+                    {
+                        "Name": "tag:kubernetes.io/cluster/{0}".format(cluster_name),
+                        "Values": ["owned"],
+                    },
+                ],
+            )
+        vol = vol["Volumes"]
+        storage_cache.put(VOLUMES, pvc_name, vol)
 
     if len(vol) > 1:
         raise Exception("\n ***** More than one volume for pvc: {0}".format(pvc_name))
@@ -57,41 +128,46 @@ def server_stopping_tags(spawner):
         vol = []
     else:
         vol = vol[0]
+        # Remembered for the next start and stop
+        spawner.volume_id = vol["VolumeId"]
 
     if vol:
-        ec2.create_tags(
-            DryRun=False,
-            Resources=[vol["VolumeId"]],
-            Tags=[
-                {
-                    "Key": "server-stop-time",
-                    "Value": "{0}".format(_get_delta_time(days=0)),
-                },
-                {
-                    "Key": "volume-delete-time",
-                    "Value": "{0}".format(
-                        _get_delta_time(days=days_till_volume_deletion)
-                    ),
-                },
-                {
-                    "Key": "snapshot-delete-time",
-                    "Value": "{0}".format(
-                        _get_delta_time(days=days_till_snapshot_deletion)
-                    ),
-                },
-            ],
-        )
+        try:
+            with timer.phase("stop_tag"):
+                await run_blocking(
+                    ec2.create_tags,
+                    DryRun=False,
+                    Resources=[vol["VolumeId"]],
+                    Tags=tags,
+                )
+        except botocore.exceptions.ClientError as e:
+            # The cached volume may have been deleted since it was looked up
+            if e.response["Error"]["Code"] != "InvalidVolume.NotFound":
+                raise
+            log.warning(f"Volume {vol['VolumeId']} no longer exists. Not tagging it.")
+            spawner.volume_id = ""
+        finally:
+            storage_cache.invalidate(pvc_name, VOLUMES)
 
 
 # After stopping the notebook server, tag the volume with the current "stopping" time. This will help determine which volumes are active.
-def my_post_hook(spawner):
+async def my_post_hook(spawner):
+    timer = PhaseTimer(
+        statsd=spawner.user.settings.get("statsd"),
+        prefix="post_stop_hook",
+        user=spawner.user.name,
+        profile=(spawner.user_options or {}).get("profile", ""),
+    )
     try:
-        server_stopping_tags(spawner)
+        await server_stopping_tags(spawner, timer)
 
     except Exception as e:
+        timer.report(log, outcome="error")
         log.error("Something went wrong with the volume stopping tag post hook...")
         log.error(e)
         raise
 
+    timer.report(log)
+
 
 c.Spawner.post_stop_hook = my_post_hook
@@ -1,8 +1,39 @@
 #!/usr/bin/env python3
 
+import asyncio
 import datetime
-import boto3
+import functools
+import json
+import time
+
+import botocore.exceptions
 import z2jh
+from kubernetes.client.rest import ApiException
+
+from oslhub.admission import AdmissionController
+from oslhub.batcher import LookupBatcher
+from oslhub.clients import (
+    get_aws_client,
+    get_core_v1_api,
+    get_custom_objects_api,
+    record_throttle,
+    throttle_count,
+)
+from oslhub.executor import run_blocking
+from oslhub.hedging import Hedger
+from oslhub.manifests import (
+    build_persistent_volume,
+    build_persistent_volume_claim,
+    build_volume_snapshot,
+    build_volume_snapshot_content,
+    load_base,
+)
+from oslhub.placement import ZonePlacer
+from oslhub.prerestore import adopt_prerestore, register_restore
+from oslhub.spawner import OSLKubeSpawner
+from oslhub.storage_cache import SNAPSHOTS, VOLUMES, get_storage_cache
+from oslhub.timing import PhaseTimer
+from oslhub.warm_pool import WarmPool
 
 import logging
 
@@ -11,6 +42,12 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
+# Parse the manifest bases at hub start instead of on every restore
+load_base("pv.yaml")
+load_base("pvc.yaml")
+load_base("volumesnapshotcontent.yaml")
+load_base("volumesnapshot.yaml")
+
 
 def get_tag_value(resource, key):
     val = [s["Value"] for s in resource["Tags"] if s["Key"] == key]
@@ -21,7 +58,928 @@ def get_tag_value(resource, key):
     return str(val[0])
 
 
-def volume_from_snapshot(spawner):
+def _group_by_pvc_name(resources: list) -> dict:
+    grouped = {}
+    for resource in resources:
+        pvc_name = get_tag_value(resource, "kubernetes.io/created-for/pvc/name")
+        grouped.setdefault(pvc_name, []).append(resource)
+    return grouped
+
+
+def _pvc_name_filter(pvc_names: list = None) -> dict:
+    # Without PVC names, match every volume or snapshot made for any PVC
+    if pvc_names is None:
+        return {"Name": "tag-key", "Values": ["kubernetes.io/created-for/pvc/name"]}
+    return {"Name": "tag:kubernetes.io/created-for/pvc/name", "Values": pvc_names}
+
+
+def describe_volumes_for_pvcs(pvc_names: list = None) -> dict:
+    cluster_name = z2jh.get_config("custom.CLUSTER_NAME")
+    ec2 = get_aws_client("ec2", z2jh.get_config("custom.AZ_NAME")[:-1])
+
+    volumes = []
+    paginator = ec2.get_paginator("describe_volumes")
+    for page in paginator.paginate(
+        Filters=[
+            _pvc_name_filter(pvc_names),
+            {
+                "Name": "tag:kubernetes.io/cluster/{0}".format(cluster_name),
+                "Values": ["owned"],
+            },
+        ]
+    ):
+        volumes.extend(page["Volumes"])
+
+    return _group_by_pvc_name(volumes)
+
+
+def describe_snapshots_for_pvcs(pvc_names: list = None) -> dict:
+    cluster_name = z2jh.get_config("custom.CLUSTER_NAME")
+    ec2 = get_aws_client("ec2", z2jh.get_config("custom.AZ_NAME")[:-1])
+
+    snapshots = []
+    paginator = ec2.get_paginator("describe_snapshots")
+    for page in paginator.paginate(
+        Filters=[
+            _pvc_name_filter(pvc_names),
+            {
+                "Name": "tag:kubernetes.io/cluster/{cluster_name}".format(
+                    cluster_name=cluster_name
+                ),
+                "Values": ["owned"],
+            },
+            {"Name": "status", "Values": ["completed"]},
+        ],
+        OwnerIds=["self"],
+    ):
+        snapshots.extend(page["Snapshots"])
+
+    return _group_by_pvc_name(snapshots)
+
+
+# Slow describe calls are sent a second time and the first answer wins. Both are read-only.
+hedger = None
+if z2jh.get_config("custom.HEDGE_PERCENTILE", 0):
+    hedger = Hedger(
+        percentile=z2jh.get_config("custom.HEDGE_PERCENTILE"),
+        budget_ratio=z2jh.get_config("custom.HEDGE_BUDGET", 0.1),
+    )
+
+# Spawns arriving within a few milliseconds of each other share one describe call per resource type
+volume_batcher = LookupBatcher(describe_volumes_for_pvcs, hedger=hedger)
+snapshot_batcher = LookupBatcher(describe_snapshots_for_pvcs, hedger=hedger)
+
+storage_cache = get_storage_cache(ttl=z2jh.get_config("custom.STORAGE_CACHE_TTL", 600))
+if z2jh.get_config("custom.STORAGE_CACHE_WARM_INTERVAL", 0):
+    storage_cache.start_warmer(
+        interval=z2jh.get_config("custom.STORAGE_CACHE_WARM_INTERVAL"),
+        list_storage=lambda: (
+            describe_volumes_for_pvcs(),
+            describe_snapshots_for_pvcs(),
+        ),
+    )
+
+# Restored volumes go to the zone with the most room for the user's profile
+zone_placer = ZonePlacer(
+    az_names=z2jh.get_config("custom.AZ_NAMES", None)
+    or [z2jh.get_config("custom.AZ_NAME")],
+    capacity_hint=z2jh.get_config("custom.AZ_CAPACITY_HINT", None),
+)
+migrate_volumes = zone_placer.multi_zone and z2jh.get_config(
+    "custom.MIGRATE_CONSTRAINED_VOLUMES", False
+)
+
+# "ec2" creates restored volumes in the hook. "csi" leaves it to the EBS CSI driver through a VolumeSnapshot.
+restore_mode = z2jh.get_config("custom.RESTORE_MODE", "ec2")
+
+# Tasks that finish CSI restores after the hook returns, by PVC name
+_csi_restores = {}
+
+# Kept on a CSI restore's VolumeSnapshot until the restore is finished, so another hub process can finish it
+CSI_RESTORE_ANNOTATION = "osl-restore"
+
+
+async def lookup_user_storage(spawner, timer: PhaseTimer) -> dict:
+    """
+    Fetch the user's PVC, EBS volumes and completed EBS snapshots concurrently.
+
+    The lookups don't depend on each other, so they are fanned out together and the results are shared
+    by `volume_from_snapshot` and `server_starting_tag`. The EC2 lookups are served from the storage cache
+    when possible and otherwise batched with those of other spawns in flight. A missing PVC is returned as None.
+
+    If the spawner already knows its volume ID and the PVC exists, EC2 isn't asked at all and the volumes and
+    snapshots are returned as None.
+    """
+
+    pvc_name = spawner.pvc_name
+    namespace = "jupyter"
+
+    api = await run_blocking(get_core_v1_api)
+
+    async def _read_pvc():
+        # Look up the one PVC by name instead of listing every PVC in the namespace
+        try:
+            return await run_blocking(
+                api.read_namespaced_persistent_volume_claim,
+                name=pvc_name,
+                namespace=namespace,
+            )
+        except ApiException as e:
+            if e.status == 404:
+                return None
+            raise
+
+    async def _lookup(kind, batcher, cached=None):
+        if cached is not None:
+            return cached
+        value = await batcher.get(pvc_name)
+        storage_cache.put(kind, pvc_name, value)
+        return value
+
+    if spawner.volume_id:
+        # The volume is already known, so EC2 only needs asking if the PVC has gone
+        pvc = await timer.measure("pvc_check", _read_pvc())
+        if pvc is not None:
+            return {"pvc": pvc, "volumes": None, "snapshots": None}
+        cached_vol, cached_snap = None, None
+        vol, snap = await asyncio.gather(
+            timer.measure("volume_lookup", _lookup(VOLUMES, volume_batcher)),
+            timer.measure("snapshot_lookup", _lookup(SNAPSHOTS, snapshot_batcher)),
+        )
+    else:
+        cached_vol = storage_cache.get(VOLUMES, pvc_name)
+        cached_snap = storage_cache.get(SNAPSHOTS, pvc_name)
+
+        pvc, vol, snap = await asyncio.gather(
+            timer.measure("pvc_check", _read_pvc()),
+            timer.measure(
+                "volume_lookup", _lookup(VOLUMES, volume_batcher, cached_vol)
+            ),
+            timer.measure(
+                "snapshot_lookup", _lookup(SNAPSHOTS, snapshot_batcher, cached_snap)
+            ),
+        )
+
+    # Without a PVC, the volumes and snapshots decide whether to restore, so they must be current
+    if pvc is None and (cached_vol is not None or cached_snap is not None):
+        vol, snap = await asyncio.gather(
+            timer.measure("volume_lookup", _lookup(VOLUMES, volume_batcher)),
+            timer.measure("snapshot_lookup", _lookup(SNAPSHOTS, snapshot_batcher)),
+        )
+
+    if pvc is None:
+        # Whatever volume backs the new PVC, it won't be the remembered one
+        spawner.volume_id = ""
+
+    return {"pvc": pvc, "volumes": vol, "snapshots": snap}
+
+
+async def wait_for_volume_available(ec2, vol_id, timeout=300):
+    """
+    Poll a newly created volume, backing off up to 10 seconds between calls, until it is `available`.
+    """
+
+    delay = 1
+    deadline = time.monotonic() + timeout
+
+    while True:
+        try:
+            vol = await run_blocking(ec2.describe_volumes, VolumeIds=[vol_id])
+            state = vol["Volumes"][0]["State"]
+        except botocore.exceptions.ClientError as e:
+            # A new volume can take a moment to show up in describe_volumes
+            if e.response["Error"]["Code"] != "InvalidVolume.NotFound":
+                raise
+            state = "creating"
+
+        if state == "available":
+            log.info(f"Volume {vol_id} is available.")
+            return
+
+        if state != "creating":
+            raise Exception(f"Volume {vol_id} is in unexpected state '{state}'")
+
+        if time.monotonic() + delay > deadline:
+            raise Exception(
+                f"Volume {vol_id} did not become available within {timeout} seconds"
+            )
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 10)
+
+
+async def wait_for_snapshot_completed(ec2, snap_id, timeout=600):
+    """
+    Poll a new snapshot, backing off up to 30 seconds between calls, until it is `completed`.
+    """
+
+    delay = 5
+    deadline = time.monotonic() + timeout
+
+    while True:
+        snap = await run_blocking(ec2.describe_snapshots, SnapshotIds=[snap_id])
+        snap = snap["Snapshots"][0]
+        state = snap["State"]
+
+        if state == "completed":
+            log.info(f"Snapshot {snap_id} is completed.")
+            return
+
+        if state != "pending":
+            raise Exception(f"Snapshot {snap_id} is in unexpected state '{state}'")
+
+        if time.monotonic() + delay > deadline:
+            raise Exception(
+                f"Snapshot {snap_id} did not complete within {timeout} seconds ({snap.get('Progress', '')})"
+            )
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+
+async def bind_volume(
+    api, vol_id, vol_size, az_name, pvc_name, namespace, spawn_pvc, timer: PhaseTimer
+):
+    """
+    Create the PV for an existing EBS volume and the user's PVC bound to it.
+    """
+
+    annotations = spawn_pvc.metadata.annotations
+
+    # Explicit annote the provisioner. The CSI plugin appears to not do this properly.
+    # May not be needed
+    # annotations.update({"pv.kubernetes.io/provisioned-by": "ebs.csi.aws.com"})
+
+    labels = spawn_pvc.metadata.labels
+
+    # The PV and PVC carry the profile's storage class so that they bind to each other
+    storage_class_name = spawn_pvc.spec.storage_class_name
+
+    # Build the manifests from the bases loaded at hub start
+    pvc_manifest = build_persistent_volume_claim(
+        name=pvc_name,
+        namespace=namespace,
+        vol_id=vol_id,
+        storage=f"{vol_size}Gi",
+        annotations=annotations,
+        labels=labels,
+        storage_class_name=storage_class_name,
+    )
+    pv_manifest = build_persistent_volume(
+        vol_id=vol_id,
+        az_name=az_name,
+        storage=f"{vol_size}Gi",
+        pvc_name=pvc_name,
+        namespace=namespace,
+        annotations=annotations,
+        storage_class_name=storage_class_name,
+    )
+
+    # https://github.com/kubernetes-client/python/blob/master/kubernetes/docs/CoreV1Api.md#create_persistent_volume
+    log.info("Creating persistent volume...")
+    try:
+        with timer.phase("pv_create"):
+            await run_blocking(api.create_persistent_volume, body=pv_manifest)
+    except ApiException as e:
+        if e.status == 409:
+            log.info(f"PV {vol_id} already exists, so did not create new pvc.")
+        else:
+            raise
+
+    # https://github.com/kubernetes-client/python/blob/master/kubernetes/docs/CoreV1Api.md#create_namespaced_persistent_volume_claim
+    log.info("Creating persistent volume claim...")
+    try:
+        with timer.phase("pvc_create"):
+            await run_blocking(
+                api.create_namespaced_persistent_volume_claim,
+                body=pvc_manifest,
+                namespace=namespace,
+            )
+    except ApiException as e:
+        if e.status == 409:
+            log.info(f"PVC {pvc_name} already exists, so did not create new pvc.")
+        else:
+            raise
+
+
+def user_volume_tags(username, cluster_name, namespace, pvc_name) -> list:
+    return [
+        {
+            "Key": "Name",
+            "Value": "{username}-{cluster_name}".format(
+                cluster_name=cluster_name, username=username
+            ),
+        },
+        {
+            "Key": "kubernetes.io/cluster/{cluster_name}".format(
+                cluster_name=cluster_name
+            ),
+            "Value": "owned",
+        },
+        {
+            "Key": "kubernetes.io/created-for/pvc/namespace",
+            "Value": namespace,
+        },
+        {
+            "Key": "kubernetes.io/created-for/pvc/name",
+            "Value": pvc_name,
+        },
+    ]
+
+
+async def _pvc_volume_id(api, pvc) -> str:
+    if not pvc.spec.volume_name:
+        return ""
+
+    pv = await run_blocking(api.read_persistent_volume, name=pvc.spec.volume_name)
+    if pv.spec.csi:
+        return pv.spec.csi.volume_handle
+    if pv.spec.aws_elastic_block_store:
+        return pv.spec.aws_elastic_block_store.volume_id.split("/")[-1]
+    return ""
+
+
+async def _delete_pvc(api, pvc_name, namespace, timeout=60):
+    await run_blocking(
+        api.delete_namespaced_persistent_volume_claim,
+        name=pvc_name,
+        namespace=namespace,
+    )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await run_blocking(
+                api.read_namespaced_persistent_volume_claim,
+                name=pvc_name,
+                namespace=namespace,
+            )
+        except ApiException as e:
+            if e.status == 404:
+                return
+            raise
+        await asyncio.sleep(1)
+
+    raise Exception(f"PVC {pvc_name} was not deleted within {timeout} seconds")
+
+
+async def migrate_constrained_volume(spawner, storage, timer: PhaseTimer):
+    """
+    Move the user's idle volume out of a constrained zone by snapshot-and-restore.
+
+    Until the old PVC is deleted, any failure leaves the user on their old volume. Deleting the PVC releases
+    the old PV, whose Delete reclaim policy then removes the old volume.
+    """
+
+    api = await run_blocking(get_core_v1_api)
+    ec2 = await run_blocking(
+        get_aws_client, "ec2", z2jh.get_config("custom.AZ_NAME")[:-1]
+    )
+
+    pvc_name = spawner.pvc_name
+    namespace = "jupyter"
+    node_selector = spawner.node_selector
+
+    vol_id = spawner.volume_id or await _pvc_volume_id(api, storage["pvc"])
+    if not vol_id:
+        return
+
+    try:
+        volume = await run_blocking(ec2.describe_volumes, VolumeIds=[vol_id])
+        volume = volume["Volumes"][0]
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] != "InvalidVolume.NotFound":
+            raise
+        return
+
+    from_az = volume["AvailabilityZone"]
+    if not await run_blocking(zone_placer.is_constrained, node_selector, from_az):
+        return
+
+    if volume["State"] != "available":
+        log.warning(
+            f"Zone {from_az} is constrained but volume {vol_id} is '{volume['State']}'. Not migrating it."
+        )
+        return
+
+    to_az = await run_blocking(zone_placer.choose, node_selector)
+    log.info(f"Migrating volume {vol_id} of {pvc_name} from {from_az} to {to_az}...")
+    timer.label(restore="migrate")
+
+    tags = [t for t in volume.get("Tags", []) if not t["Key"].startswith("aws:")]
+    tags.append({"Key": "MigratedFromVolume", "Value": vol_id})
+
+    # Keep the volume's performance settings
+    performance = {}
+    if volume["VolumeType"] in ("gp3", "io1", "io2") and volume.get("Iops"):
+        performance["Iops"] = volume["Iops"]
+    if volume.get("Throughput"):
+        performance["Throughput"] = volume["Throughput"]
+
+    new_vol_id = None
+    try:
+        spawner.restore_progress(
+            f"Zone {from_az} is full. Moving your home directory to {to_az}", 5
+        )
+        snap = await timer.measure(
+            "migrate_snapshot",
+            run_blocking(
+                ec2.create_snapshot,
+                VolumeId=vol_id,
+                Description=f"Migration of {pvc_name} from {from_az} to {to_az}",
+                TagSpecifications=[{"ResourceType": "snapshot", "Tags": tags}],
+            ),
+        )
+        storage_cache.invalidate(pvc_name, SNAPSHOTS)
+        with timer.phase("snapshot_completed"):
+            await wait_for_snapshot_completed(
+                ec2,
+                snap["SnapshotId"],
+                timeout=z2jh.get_config("custom.VOLUME_MIGRATION_TIMEOUT", 600),
+            )
+
+        spawner.restore_progress(
+            f"Creating {volume['Size']} GiB volume in {to_az} from your snapshot", 10
+        )
+        vol = await timer.measure(
+            "create_volume",
+            run_blocking(
+                ec2.create_volume,
+                AvailabilityZone=to_az,
+                Encrypted=volume["Encrypted"],
+                Size=volume["Size"],
+                SnapshotId=snap["SnapshotId"],
+                VolumeType=volume["VolumeType"],
+                DryRun=False,
+                TagSpecifications=[{"ResourceType": "volume", "Tags": tags}],
+                **performance,
+            ),
+        )
+        new_vol_id = vol["VolumeId"]
+        storage_cache.invalidate(pvc_name, VOLUMES)
+
+        spawner.restore_progress(f"Waiting for volume {new_vol_id} to be ready", 15)
+        with timer.phase("volume_available"):
+            await wait_for_volume_available(ec2, new_vol_id)
+
+    except Exception as e:
+        log.error(
+            f"Could not migrate volume {vol_id} to {to_az}. Staying in {from_az}: {e}"
+        )
+        timer.label(restore="none")
+        if new_vol_id:
+            try:
+                await run_blocking(ec2.delete_volume, VolumeId=new_vol_id)
+            except Exception as e:
+                log.error(f"Could not delete unused volume {new_vol_id}: {e}")
+            storage_cache.invalidate(pvc_name, VOLUMES)
+        return
+
+    spawner.restore_progress("Binding the moved volume to your home directory", 25)
+    with timer.phase("pvc_delete"):
+        await _delete_pvc(api, pvc_name, namespace)
+
+    storage["volumes"] = [vol]
+    spawner.volume_id = new_vol_id
+    spawner.mark_home_restored()
+
+    await bind_volume(
+        api,
+        vol_id=new_vol_id,
+        vol_size=volume["Size"],
+        az_name=to_az,
+        pvc_name=pvc_name,
+        namespace=namespace,
+        spawn_pvc=spawner.get_pvc_manifest(),
+        timer=timer,
+    )
+    log.info(f"Volume of {pvc_name} migrated from {vol_id} to {new_vol_id}.")
+
+
+async def restore_volume(
+    spawner, storage, api, ec2, snapshot_id, vol_size, tags, spawn_pvc, timer
+):
+    """
+    Create the user's volume from a snapshot and bind it to their PVC.
+    """
+
+    if restore_mode == "csi":
+        await restore_volume_with_csi(
+            spawner, storage, api, ec2, snapshot_id, vol_size, tags, spawn_pvc, timer
+        )
+        return
+
+    pvc_name = spawner.pvc_name
+    namespace = "jupyter"
+
+    # Snapshots are regional, so restore in the zone with the most room
+    restore_az = await run_blocking(zone_placer.choose, spawner.node_selector)
+
+    log.info(f"Creating volume from snapshot {snapshot_id} in {restore_az}...")
+    spawner.restore_progress(
+        f"Creating {vol_size} GiB volume for your home directory", 10
+    )
+    vol = await timer.measure(
+        "create_volume",
+        run_blocking(
+            ec2.create_volume,
+            AvailabilityZone=restore_az,
+            Encrypted=False,
+            Size=vol_size,
+            SnapshotId=snapshot_id,
+            DryRun=False,
+            TagSpecifications=[
+                {
+                    "ResourceType": "volume",
+                    "Tags": tags,
+                },
+            ],
+            # The profile's volume type, IOPS and throughput
+            **spawner.volume_performance(),
+        ),
+    )
+    vol_id = vol["VolumeId"]
+    log.info(f"Volume {vol_id} created.")
+    storage_cache.invalidate(pvc_name, VOLUMES)
+
+    # The start tag goes on the restored volume
+    storage["volumes"] = [vol]
+    spawner.volume_id = vol_id
+    spawner.mark_home_restored()
+
+    # Binding the PV before the volume is available only leads to attach retries
+    spawner.restore_progress(f"Waiting for volume {vol_id} to be ready", 15)
+    with timer.phase("volume_available"):
+        await wait_for_volume_available(ec2, vol_id)
+
+    spawner.restore_progress("Binding the volume to your home directory", 25)
+    await bind_volume(
+        api,
+        vol_id=vol_id,
+        vol_size=vol_size,
+        az_name=restore_az,
+        pvc_name=pvc_name,
+        namespace=namespace,
+        spawn_pvc=spawn_pvc,
+        timer=timer,
+    )
+
+
+async def restore_volume_with_csi(
+    spawner,
+    storage,
+    api,
+    ec2,
+    snapshot_id,
+    vol_size,
+    tags,
+    spawn_pvc,
+    timer: PhaseTimer,
+):
+    """
+    Import the snapshot as a VolumeSnapshot and create the user's PVC with it as the dataSource.
+
+    The EBS CSI driver creates the volume, in the PVC's storage class, while the pod is being scheduled. The
+    volume is tagged, start tag included, once the PVC is bound by `finish_csi_restore`, which runs after the
+    hook returns. Until then the volume ID isn't known.
+    """
+
+    pvc_name = spawner.pvc_name
+    namespace = "jupyter"
+
+    custom_api = await run_blocking(get_custom_objects_api)
+
+    # A golden snapshot is shared by many users, so the names are per user
+    snapshot_name = f"{pvc_name}-{snapshot_id}"
+    snapshot_content = build_volume_snapshot_content(
+        name=snapshot_name,
+        snapshot_id=snapshot_id,
+        snapshot_name=snapshot_name,
+        namespace=namespace,
+    )
+    volume_snapshot = build_volume_snapshot(
+        name=snapshot_name,
+        namespace=namespace,
+        content_name=snapshot_name,
+        labels=spawn_pvc.metadata.labels,
+        annotations={
+            CSI_RESTORE_ANNOTATION: json.dumps({"pvc_name": pvc_name, "tags": tags})
+        },
+    )
+    group, version = volume_snapshot["apiVersion"].split("/")
+
+    log.info(f"Importing snapshot {snapshot_id} as VolumeSnapshot {snapshot_name}...")
+    spawner.restore_progress(
+        f"Restoring {vol_size} GiB volume for your home directory", 10
+    )
+    with timer.phase("snapshot_import"):
+        # Either may be left over from an earlier attempt
+        for create, kwargs in (
+            (
+                custom_api.create_cluster_custom_object,
+                {"plural": "volumesnapshotcontents", "body": snapshot_content},
+            ),
+            (
+                custom_api.create_namespaced_custom_object,
+                {
+                    "plural": "volumesnapshots",
+                    "namespace": namespace,
+                    "body": volume_snapshot,
+                },
+            ),
+        ):
+            try:
+                await run_blocking(create, group=group, version=version, **kwargs)
+            except ApiException as e:
+                if e.status == 409:
+                    log.info(
+                        f"{kwargs['body']['kind']} {snapshot_name} already exists."
+                    )
+                else:
+                    raise
+
+    pvc_manifest = build_persistent_volume_claim(
+        name=pvc_name,
+        namespace=namespace,
+        vol_id=None,
+        storage=f"{vol_size}Gi",
+        annotations=spawn_pvc.metadata.annotations,
+        labels=spawn_pvc.metadata.labels,
+        storage_class_name=spawn_pvc.spec.storage_class_name,
+        snapshot_name=snapshot_name,
+    )
+
+    log.info("Creating persistent volume claim from the snapshot...")
+    try:
+        with timer.phase("pvc_create"):
+            await run_blocking(
+                api.create_namespaced_persistent_volume_claim,
+                body=pvc_manifest,
+                namespace=namespace,
+            )
+    except ApiException as e:
+        if e.status == 409:
+            log.info(f"PVC {pvc_name} already exists, so did not create new pvc.")
+        else:
+            raise
+
+    # The driver's volume replaces whatever was cached, and any remembered volume ID is stale
+    storage_cache.invalidate(pvc_name, VOLUMES)
+    spawner.volume_id = ""
+    storage["csi_restore"] = True
+    spawner.mark_home_restored()
+
+    _start_csi_finish(
+        api, custom_api, ec2, pvc_name, snapshot_name, tags, spawner=spawner
+    )
+
+
+def _start_csi_finish(
+    api, custom_api, ec2, pvc_name, snapshot_name, tags, spawner=None
+) -> None:
+    task = _csi_restores.get(pvc_name)
+    if task is not None:
+        return
+
+    task = asyncio.ensure_future(
+        finish_csi_restore(
+            api, custom_api, ec2, pvc_name, snapshot_name, tags, spawner=spawner
+        )
+    )
+    _csi_restores[pvc_name] = task
+
+    def _done(task):
+        if _csi_restores.get(pvc_name) is task:
+            del _csi_restores[pvc_name]
+
+    task.add_done_callback(_done)
+
+
+async def finish_csi_restore(
+    api, custom_api, ec2, pvc_name, snapshot_name, tags, spawner=None, timeout=600
+):
+    """
+    Wait for the CSI driver to bind the restored PVC, then tag its volume and remove the VolumeSnapshot.
+
+    The VolumeSnapshotContent is Retain, so removing it leaves the EBS snapshot in place. If the PVC isn't bound
+    within `timeout`, such as when the server was stopped first, the VolumeSnapshot is left for
+    `resume_csi_restore` at the user's next start. If the PVC is gone, there is nothing left to tag.
+    """
+
+    namespace = "jupyter"
+
+    try:
+        delay = 1
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                pvc = await run_blocking(
+                    api.read_namespaced_persistent_volume_claim,
+                    name=pvc_name,
+                    namespace=namespace,
+                )
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+                log.info(f"PVC {pvc_name} is gone. Not tagging its restored volume.")
+                pvc = None
+                break
+            if pvc.status and pvc.status.phase == "Bound":
+                break
+            if time.monotonic() + delay > deadline:
+                log.info(
+                    f"PVC {pvc_name} was not bound within {timeout} seconds. The restore will be finished at its next start."
+                )
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 10)
+
+        if pvc is not None:
+            vol_id = await _pvc_volume_id(api, pvc)
+            start_time = "{0}".format(
+                datetime.datetime.now(datetime.timezone.utc).replace(
+                    second=0, microsecond=0
+                )
+            )
+            await run_blocking(
+                ec2.create_tags,
+                DryRun=False,
+                Resources=[vol_id],
+                Tags=tags + [{"Key": "server-start-time", "Value": start_time}],
+            )
+            if spawner is not None:
+                spawner.volume_id = vol_id
+            storage_cache.invalidate(pvc_name, VOLUMES)
+            log.info(f"Volume {vol_id} restored by the CSI driver for {pvc_name}.")
+
+        group, version = load_base("volumesnapshot.yaml")["apiVersion"].split("/")
+        for delete, kwargs in (
+            (
+                custom_api.delete_namespaced_custom_object,
+                {"plural": "volumesnapshots", "namespace": namespace},
+            ),
+            (
+                custom_api.delete_cluster_custom_object,
+                {"plural": "volumesnapshotcontents"},
+            ),
+        ):
+            try:
+                await run_blocking(
+                    delete, group=group, version=version, name=snapshot_name, **kwargs
+                )
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+
+    except Exception as e:
+        log.error(f"Could not finish the CSI restore of {pvc_name}: {e}")
+
+
+async def resume_csi_restore(spawner, storage, api, ec2) -> None:
+    """
+    Finish a CSI restore of the user's existing PVC that an earlier hub process or spawn left unfinished. Its
+    VolumeSnapshot is only deleted once the restore is finished.
+    """
+
+    pvc = storage["pvc"]
+    data_source = pvc.spec.data_source
+    if data_source is None or data_source.kind != "VolumeSnapshot":
+        return
+
+    pvc_name = spawner.pvc_name
+    if pvc_name in _csi_restores:
+        storage["csi_restore"] = True
+        return
+
+    custom_api = await run_blocking(get_custom_objects_api)
+    group, version = load_base("volumesnapshot.yaml")["apiVersion"].split("/")
+    try:
+        volume_snapshot = await run_blocking(
+            custom_api.get_namespaced_custom_object,
+            group=group,
+            version=version,
+            namespace=pvc.metadata.namespace,
+            plural="volumesnapshots",
+            name=data_source.name,
+        )
+    except ApiException as e:
+        if e.status == 404:
+            return
+        raise
+
+    annotations = volume_snapshot["metadata"].get("annotations") or {}
+    if CSI_RESTORE_ANNOTATION not in annotations:
+        return
+    restore = json.loads(annotations[CSI_RESTORE_ANNOTATION])
+
+    log.info(f"Resuming the unfinished CSI restore of {pvc_name}...")
+    storage["csi_restore"] = True
+    _start_csi_finish(
+        api,
+        custom_api,
+        ec2,
+        pvc_name,
+        data_source.name,
+        restore["tags"],
+        spawner=spawner,
+    )
+
+
+async def resume_csi_restores() -> None:
+    """
+    Finish the CSI restores a previous hub process left unfinished, found by their VolumeSnapshots.
+    """
+
+    namespace = "jupyter"
+
+    try:
+        api = await run_blocking(get_core_v1_api)
+        custom_api = await run_blocking(get_custom_objects_api)
+        ec2 = await run_blocking(
+            get_aws_client, "ec2", z2jh.get_config("custom.AZ_NAME")[:-1]
+        )
+        group, version = load_base("volumesnapshot.yaml")["apiVersion"].split("/")
+        volume_snapshots = await run_blocking(
+            custom_api.list_namespaced_custom_object,
+            group=group,
+            version=version,
+            namespace=namespace,
+            plural="volumesnapshots",
+        )
+    except Exception as e:
+        log.error(f"Could not look for unfinished CSI restores: {e}")
+        return
+
+    for volume_snapshot in volume_snapshots["items"]:
+        annotations = volume_snapshot["metadata"].get("annotations") or {}
+        if CSI_RESTORE_ANNOTATION not in annotations:
+            continue
+        restore = json.loads(annotations[CSI_RESTORE_ANNOTATION])
+
+        log.info(f"Resuming the unfinished CSI restore of {restore['pvc_name']}...")
+        _start_csi_finish(
+            api,
+            custom_api,
+            ec2,
+            restore["pvc_name"],
+            volume_snapshot["metadata"]["name"],
+            restore["tags"],
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def golden_snapshot_size(snapshot_id: str) -> int:
+    ec2 = get_aws_client("ec2", z2jh.get_config("custom.AZ_NAME")[:-1])
+    snap = ec2.describe_snapshots(SnapshotIds=[snapshot_id])["Snapshots"][0]
+    if snap["State"] != "completed":
+        # Not cached, so a later spawn asks again
+        raise Exception(f"Golden snapshot {snapshot_id} is '{snap['State']}'")
+    return snap["VolumeSize"]
+
+
+async def seed_from_golden_snapshot(
+    spawner, storage, api, ec2, vol_size, spawn_pvc, timer: PhaseTimer
+):
+    """
+    Create a first-time user's volume from their profile's golden snapshot, so course content and packages
+    are already in place on their first start.
+    """
+
+    snapshot_id = spawner.golden_snapshot_id
+    cluster_name = z2jh.get_config("custom.CLUSTER_NAME")
+
+    spawner.restore_progress("Setting up your home directory with starter content", 5)
+
+    with timer.phase("snapshot_lookup"):
+        vol_size = max(vol_size, await run_blocking(golden_snapshot_size, snapshot_id))
+
+    tags = user_volume_tags(
+        spawner.user.name, cluster_name, "jupyter", spawner.pvc_name
+    )
+    tags.append({"Key": "RestoredFromSnapshot", "Value": "True"})
+    tags.append({"Key": "GoldenSnapshot", "Value": snapshot_id})
+    tags.append(
+        {
+            "Key": z2jh.get_config("custom.COST_TAG_KEY"),
+            "Value": z2jh.get_config("custom.COST_TAG_VALUE"),
+        }
+    )
+
+    timer.label(restore="golden")
+    await restore_volume(
+        spawner,
+        storage,
+        api,
+        ec2,
+        snapshot_id=snapshot_id,
+        vol_size=vol_size,
+        tags=tags,
+        spawn_pvc=spawn_pvc,
+        timer=timer,
+    )
+
+
+async def volume_from_snapshot(spawner, storage, timer: PhaseTimer):
     """
     # Before mounting the home directory, check to see if a volume exists.
     # If it doesn't, check for any EBS snapshots.
@@ -31,16 +989,9 @@ def volume_from_snapshot(spawner):
 
     import re
 
-    import boto3
-    import yaml
-    from kubernetes import client as k8s_client
-    from kubernetes import config as k8s_config
-    from kubernetes.client.rest import ApiException
-
     import z2jh
 
-    k8s_config.load_incluster_config()
-    api = k8s_client.CoreV1Api()
+    api = await run_blocking(get_core_v1_api)
 
     username = spawner.user.name
     pvc_name = spawner.pvc_name
@@ -52,7 +1003,6 @@ def volume_from_snapshot(spawner):
     vol_size = spawner.storage_capacity
     spawn_pvc = spawner.get_pvc_manifest()
     region_name = az_name[:-1]
-    etc_dir = "/usr/local/etc/jupyterhub/jupyterhub_config.d/etc"
 
     log.info(
         f"Spawner gives storage as {vol_size}. If restoring from a snapshot, the size may be different."
@@ -84,22 +1034,21 @@ def volume_from_snapshot(spawner):
     if vol_size < 0:
         vol_size = 1
 
-    session = boto3.Session(region_name=region_name)
-    ec2 = session.client("ec2")
-
-    pvcs = api.list_namespaced_persistent_volume_claim(namespace=namespace, watch=False)
+    ec2 = await run_blocking(get_aws_client, "ec2", region_name)
 
-    has_pvc = False
-    for items in pvcs.items:
-        if items.metadata.name == pvc_name:
-            log.warning(
-                "PVC '{pvc_name}' exists! Therefore a volume should have already been assigned to user '{username}'.".format(
-                    pvc_name=pvc_name, username=username
-                )
+    if storage["pvc"] is not None:
+        log.warning(
+            "PVC '{pvc_name}' exists! Therefore a volume should have already been assigned to user '{username}'.".format(
+                pvc_name=pvc_name, username=username
             )
-            has_pvc = True
+        )
+
+        if migrate_volumes:
+            await migrate_constrained_volume(spawner, storage, timer)
 
-    if not has_pvc:
+        with timer.phase("csi_restore_check"):
+            await resume_csi_restore(spawner, storage, api, ec2)
+    else:
         log.warning(
             "PVC '{pvc_name}' does not exist. Therefore a volume will have to be created for user '{username}'.".format(
                 pvc_name=pvc_name, username=username
@@ -107,20 +1056,7 @@ def volume_from_snapshot(spawner):
         )
 
         # Does the user have any volumes?
-        vol = ec2.describe_volumes(
-            Filters=[
-                {
-                    "Name": "tag:kubernetes.io/created-for/pvc/name",
-                    "Values": [pvc_name],
-                },
-                {
-                    "Name": "tag:kubernetes.io/cluster/{0}".format(cluster_name),
-                    "Values": ["owned"],
-                },
-            ]
-        )
-
-        volumes = vol["Volumes"]
+        volumes = storage["volumes"]
         if len(volumes) > 1:
             volumes = sorted(volumes, key=lambda s: s["CreateTime"], reverse=True)
             log.warning(
@@ -133,23 +1069,7 @@ def volume_from_snapshot(spawner):
         volume = volumes[0]
 
         # Does the user have any snapshots?
-        snap = ec2.describe_snapshots(
-            Filters=[
-                {
-                    "Name": "tag:kubernetes.io/created-for/pvc/name",
-                    "Values": [pvc_name],
-                },
-                {
-                    "Name": "tag:kubernetes.io/cluster/{cluster_name}".format(
-                        cluster_name=cluster_name
-                    ),
-                    "Values": ["owned"],
-                },
-                {"Name": "status", "Values": ["completed"]},
-            ],
-            OwnerIds=["self"],
-        )
-        snap = snap["Snapshots"]
+        snap = storage["snapshots"]
 
         if len(snap) > 1:
             snap = sorted(snap, key=lambda s: s["StartTime"], reverse=True)
@@ -166,247 +1086,175 @@ def volume_from_snapshot(spawner):
         # Skip for now till unbroken
         ##if volume:
         if False:
-            annotations = spawn_pvc.metadata.annotations
-            labels = spawn_pvc.metadata.labels
             vol_size = volume["Size"]
             vol_id = volume["VolumeId"]
 
-            # Get PVC manifest
-            with open(f"{etc_dir}/pvc.yaml", mode="r") as f:
-                pvc_yaml = f.read().format(
-                    annotations=annotations,
-                    cluster_name=cluster_name,
-                    labels=labels,
-                    name=pvc_name,
-                    namespace=namespace,
-                    vol_size=vol_size,
-                    vol_id=vol_id,
-                )
-
-            pvc_manifest = yaml.safe_load(pvc_yaml)
-
-            # Get PV manifest
-            with open(f"{etc_dir}/pv.yaml", mode="r") as f:
-                pv_yaml = f.read()
-
-            annotations = pvc_manifest["metadata"]["annotations"]
-
-            pv_yaml = pv_yaml.format(
-                annotations=annotations,
-                cluster_name=cluster_name,
-                region_name=region_name,
-                az_name=az_name,
+            await bind_volume(
+                api,
+                vol_id=vol_id,
+                vol_size=vol_size,
+                az_name=volume["AvailabilityZone"],
                 pvc_name=pvc_name,
                 namespace=namespace,
-                vol_id=vol_id,
-                storage=pvc_manifest["spec"]["resources"]["requests"]["storage"],
+                spawn_pvc=spawn_pvc,
+                timer=timer,
             )
 
-            pv_manifest = yaml.safe_load(pv_yaml)
-
-            # https://github.com/kubernetes-client/python/blob/master/kubernetes/docs/CoreV1Api.md#create_persistent_volume
-            log.info("Creating persistent volume...")
-            try:
-                api.create_persistent_volume(body=pv_manifest)
-            except ApiException as e:
-                if e.status == 409:
-                    log.info(f"PV {vol_id} already exists, so did not create new pvc.")
-                else:
-                    raise
-
-            # https://github.com/kubernetes-client/python/blob/master/kubernetes/docs/CoreV1Api.md#create_namespaced_persistent_volume_claim
-            log.info("Creating persistent volume claim...")
-            try:
-                api.create_namespaced_persistent_volume_claim(
-                    body=pvc_manifest, namespace=namespace
-                )
-            except ApiException as e:
-                if e.status == 409:
-                    log.info(
-                        f"PVC {pvc_name} already exists, so did not create new pvc."
-                    )
-                else:
-                    raise
-
-            ec2.create_tags(
+            await run_blocking(
+                ec2.create_tags,
                 DryRun=False,
                 Resources=[vol_id],
                 Tags=[
                     {"Key": "created-pvc-from-volume", "Value": "True"},
                 ],
             )
+            storage_cache.invalidate(pvc_name, VOLUMES)
 
         elif snapshot:
+            spawner.restore_progress(
+                f"Found snapshot {snapshot['SnapshotId']} of your home directory", 5
+            )
+
             # Guarantee that the volume never shrinks if the spawner's volume is smaller than the snapshot
             if snapshot["VolumeSize"] > vol_size:
                 vol_size = snapshot["VolumeSize"]
 
-            log.info("Creating volume from snapshot...")
-            vol = ec2.create_volume(
-                AvailabilityZone=az_name,
-                Encrypted=False,
-                Size=vol_size,
-                SnapshotId=snapshot["SnapshotId"],
-                VolumeType="gp3",
-                DryRun=False,
-                TagSpecifications=[
-                    {
-                        "ResourceType": "volume",
-                        "Tags": [
-                            {
-                                "Key": "Name",
-                                "Value": "{username}-{cluster_name}".format(
-                                    cluster_name=cluster_name, username=username
-                                ),
-                            },
-                            {
-                                "Key": "kubernetes.io/cluster/{cluster_name}".format(
-                                    cluster_name=cluster_name
-                                ),
-                                "Value": "owned",
-                            },
-                            {
-                                "Key": "kubernetes.io/created-for/pvc/namespace",
-                                "Value": namespace,
-                            },
-                            {
-                                "Key": "kubernetes.io/created-for/pvc/name",
-                                "Value": pvc_name,
-                            },
-                            {"Key": "RestoredFromSnapshot", "Value": "True"},
-                        ],
-                    },
-                ],
-            )
-            vol_id = vol["VolumeId"]
-            log.info(f"Volume {vol_id} created.")
+            # Carry the snapshot's tags over to the volume within the create_volume call
+            tags = user_volume_tags(username, cluster_name, namespace, pvc_name)
+            tags.append({"Key": "RestoredFromSnapshot", "Value": "True"})
 
             this_val = get_tag_value(snapshot, "jupyter-volume-stopping-time")
             if this_val:
-                ec2.create_tags(
-                    DryRun=False,
-                    Resources=[vol_id],
-                    Tags=[
-                        {"Key": "jupyter-volume-stopping-time", "Value": this_val},
-                    ],
-                )
+                tags.append({"Key": "jupyter-volume-stopping-time", "Value": this_val})
 
             # If do-not-delete tag was present in snapshot, add to volume tags
             if get_tag_value(snapshot, "do-not-delete"):
-                ec2.create_tags(
-                    DryRun=False,
-                    Resources=[vol_id],
-                    Tags=[
-                        {"Key": "do-not-delete", "Value": "True"},
-                    ],
-                )
+                tags.append({"Key": "do-not-delete", "Value": "True"})
 
             # If the billing tag is present in the snapshot, add to volume tags
             # If the tag doesn't exist in the snapshot, the default is `cost_tag_value`
             this_val = get_tag_value(snapshot, cost_tag_key)
             if not this_val:
                 this_val = cost_tag_value
-            ec2.create_tags(
-                DryRun=False,
-                Resources=[vol_id],
-                Tags=[
-                    {"Key": cost_tag_key, "Value": this_val},
-                ],
+            tags.append({"Key": cost_tag_key, "Value": this_val})
+
+            timer.label(restore="snapshot")
+            await restore_volume(
+                spawner,
+                storage,
+                api,
+                ec2,
+                snapshot_id=snapshot["SnapshotId"],
+                vol_size=vol_size,
+                tags=tags,
+                spawn_pvc=spawn_pvc,
+                timer=timer,
             )
 
-            annotations = spawn_pvc.metadata.annotations
-
-            # Explicit annote the provisioner. The CSI plugin appears to not do this properly.
-            # May not be needed
-            # annotations.update({"pv.kubernetes.io/provisioned-by": "ebs.csi.aws.com"})
+        else:
+            # New users start from their profile's golden snapshot when it has one
+            if spawner.golden_snapshot_id:
+                try:
+                    await seed_from_golden_snapshot(
+                        spawner, storage, api, ec2, vol_size, spawn_pvc, timer
+                    )
+                    return
+                except Exception as e:
+                    # Once the volume exists, falling back would give the user a second one
+                    if spawner.volume_id:
+                        raise
+                    log.error(
+                        f"Could not seed {pvc_name} from golden snapshot {spawner.golden_snapshot_id}: {e}"
+                    )
+                    timer.label(restore="none")
+
+            # Pool volumes are baseline gp3, so profiles with a faster tier get a dynamically provisioned one
+            vol_id = None
+            if (
+                warm_pool.target > 0
+                and spawner.volume_performance() == {"VolumeType": "gp3"}
+                and not await run_blocking(
+                    zone_placer.is_constrained, spawner.node_selector, warm_pool.az_name
+                )
+            ):
+                with timer.phase("warm_pool_claim"):
+                    vol_id = await run_blocking(
+                        warm_pool.claim,
+                        size_gib=vol_size,
+                        tags=user_volume_tags(
+                            username, cluster_name, namespace, pvc_name
+                        ),
+                    )
 
-            labels = spawn_pvc.metadata.labels
+            if vol_id:
+                log.info(f"Giving warm pool volume {vol_id} to {pvc_name}")
+                timer.label(restore="warm_pool")
+                storage_cache.invalidate(pvc_name, VOLUMES)
+                storage["volumes"] = [{"VolumeId": vol_id}]
+                spawner.volume_id = vol_id
 
-            # Get PVC manifest
-            with open(f"{etc_dir}/pvc.yaml", mode="r") as f:
-                pvc_yaml = f.read().format(
-                    annotations=annotations,
-                    cluster_name=cluster_name,
-                    labels=labels,
-                    name=pvc_name,
-                    namespace=namespace,
-                    vol_size=vol_size,
+                spawner.restore_progress(
+                    "Binding a new volume to your home directory", 25
+                )
+                await bind_volume(
+                    api,
                     vol_id=vol_id,
+                    vol_size=vol_size,
+                    az_name=warm_pool.az_name,
+                    pvc_name=pvc_name,
+                    namespace=namespace,
+                    spawn_pvc=spawn_pvc,
+                    timer=timer,
                 )
-
-            pvc_manifest = yaml.safe_load(pvc_yaml)
-
-            # Get PV manifest
-            with open(f"{etc_dir}/pv.yaml", mode="r") as f:
-                pv_yaml = f.read()
-
-            annotations = pvc_manifest["metadata"]["annotations"]
-
-            pv_yaml = pv_yaml.format(
-                annotations=annotations,
-                cluster_name=cluster_name,
-                region_name=region_name,
-                az_name=az_name,
-                pvc_name=pvc_name,
-                namespace=namespace,
-                vol_id=vol_id,
-                storage=pvc_manifest["spec"]["resources"]["requests"]["storage"],
-            )
-
-            pv_manifest = yaml.safe_load(pv_yaml)
-
-            # https://github.com/kubernetes-client/python/blob/master/kubernetes/docs/CoreV1Api.md#create_persistent_volume
-            log.info("Creating persistent volume...")
-            try:
-                api.create_persistent_volume(body=pv_manifest)
-            except ApiException as e:
-                if e.status == 409:
-                    log.info(f"PV {vol_id} already exists, so did not create new pvc.")
-                else:
-                    raise
-
-            # https://github.com/kubernetes-client/python/blob/master/kubernetes/docs/CoreV1Api.md#create_namespaced_persistent_volume_claim
-            log.info("Creating persistent volume claim...")
-            try:
-                api.create_namespaced_persistent_volume_claim(
-                    body=pvc_manifest, namespace=namespace
+            else:
+                log.info(
+                    f"No volumes found nor restored from snapshot. Allow JupyterHub to create a new volume for {pvc_name}"
                 )
-            except ApiException as e:
-                if e.status == 409:
-                    log.info(
-                        f"PVC {pvc_name} already exists, so did not create new pvc."
-                    )
-                else:
-                    raise
 
-        else:
-            log.info(
-                f"No volumes found nor restored from snapshot. Allow JupyterHub to create a new volume for {pvc_name}"
-            )
 
-
-def server_starting_tag(spawner):
+async def server_starting_tag(spawner, storage, timer: PhaseTimer):
     pvc_name = spawner.pvc_name
     cluster_name = z2jh.get_config("custom.CLUSTER_NAME")
     az_name = z2jh.get_config("custom.AZ_NAME")
     region_name = az_name[:-1]
 
-    session = boto3.Session(region_name=region_name)
-    ec2 = session.client("ec2")
+    ec2 = await run_blocking(get_aws_client, "ec2", region_name)
 
     log.info(f"Updating starting tags to '{pvc_name}' in cluster '{cluster_name}'...")
 
-    vol = ec2.describe_volumes(
-        Filters=[
-            {"Name": "tag:kubernetes.io/created-for/pvc/name", "Values": [pvc_name]},
-            {
-                "Name": "tag:kubernetes.io/cluster/{0}".format(cluster_name),
-                "Values": ["owned"],
-            },
-        ]
+    start_time = "{0}".format(
+        datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
     )
 
-    vol = vol["Volumes"]
+    if storage.get("csi_restore"):
+        log.info(
+            f"The start tag goes on with the restore tags once the CSI driver binds '{pvc_name}'."
+        )
+        return
+
+    if spawner.volume_id:
+        try:
+            with timer.phase("start_tag"):
+                await run_blocking(
+                    ec2.create_tags,
+                    DryRun=False,
+                    Resources=[spawner.volume_id],
+                    Tags=[{"Key": "server-start-time", "Value": start_time}],
+                )
+            storage_cache.invalidate(pvc_name, VOLUMES)
+            return
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidVolume.NotFound":
+                raise
+            log.warning(
+                f"Remembered volume {spawner.volume_id} no longer exists. Searching for the volume of '{pvc_name}'..."
+            )
+            spawner.volume_id = ""
+
+    vol = storage["volumes"]
+    if vol is None:
+        with timer.phase("volume_lookup"):
+            vol = await volume_batcher.get(pvc_name)
 
     if len(vol) > 1:
         raise Exception("\n ***** More than one volume for pvc: {0}".format(pvc_name))
@@ -415,32 +1263,156 @@ def server_starting_tag(spawner):
         vol = []
     else:
         vol = vol[0]
+        spawner.volume_id = vol["VolumeId"]
 
     if vol:
-        ec2.create_tags(
-            DryRun=False,
-            Resources=[vol["VolumeId"]],
-            Tags=[
-                {
-                    "Key": "server-start-time",
-                    "Value": "{0}".format(
-                        datetime.datetime.now(datetime.timezone.utc).replace(
-                            second=0, microsecond=0
-                        )
-                    ),
-                },
-            ],
+        try:
+            with timer.phase("start_tag"):
+                await run_blocking(
+                    ec2.create_tags,
+                    DryRun=False,
+                    Resources=[vol["VolumeId"]],
+                    Tags=[
+                        {
+                            "Key": "server-start-time",
+                            "Value": start_time,
+                        },
+                    ],
+                )
+        except botocore.exceptions.ClientError as e:
+            # The cached volume may have been deleted since it was looked up
+            if e.response["Error"]["Code"] != "InvalidVolume.NotFound":
+                raise
+            log.warning(f"Volume {vol['VolumeId']} no longer exists. Not tagging it.")
+            spawner.volume_id = ""
+        finally:
+            storage_cache.invalidate(pvc_name, VOLUMES)
+
+
+def _new_timer(spawner, prefix: str) -> PhaseTimer:
+    return PhaseTimer(
+        statsd=spawner.user.settings.get("statsd"),
+        prefix=prefix,
+        user=spawner.user.name,
+        profile=(spawner.user_options or {}).get("profile", ""),
+        restore="none",
+    )
+
+
+async def prerestore_volume(spawner):
+    """
+    Restore the user's volume at login when they have a snapshot but no PVC or volume.
+    """
+    timer = _new_timer(spawner, "prerestore")
+    try:
+        # The user hasn't picked a profile yet, so size the volume for the one they used last
+        with timer.phase("load_profile"):
+            await spawner.load_last_user_options()
+
+        storage = await lookup_user_storage(spawner, timer)
+        if storage["pvc"] is None and not storage["volumes"] and storage["snapshots"]:
+            await volume_from_snapshot(spawner, storage, timer)
+    except Exception:
+        timer.report(log, outcome="error")
+        raise
+    timer.report(log)
+
+
+# Phases spent waiting rather than calling an API. They are taken off the hook's time for admission latency.
+WAIT_PHASES = (
+    "admission_wait",
+    "adopt_prerestore",
+    "volume_available",
+    "snapshot_completed",
+)
+
+
+def _queue_position(spawner):
+    def on_position(position):
+        spawner.restore_progress(
+            f"Many servers are starting. You are number {position} in line"
         )
 
+    return on_position
 
-def my_pre_hook(spawner):
+
+async def my_pre_hook(spawner):
+    timer = _new_timer(spawner, "pre_spawn_hook")
+    spawner.start_restore_progress()
+    admitted = False
     try:
-        volume_from_snapshot(spawner)
-        server_starting_tag(spawner)
+        if admission is not None:
+            with timer.phase("admission_wait"):
+                await admission.acquire(on_position=_queue_position(spawner))
+            admitted = True
+            if timer.statsd is not None:
+                timer.statsd.gauge(
+                    "pre_spawn_hook.admission_limit", int(admission.limit)
+                )
+                timer.statsd.gauge("pre_spawn_hook.admission_queued", admission.queued)
+
+        with timer.phase("adopt_prerestore"):
+            spawner.restore_progress("Checking your home directory", 1)
+            await adopt_prerestore(spawner)
+
+        # Apply the profile now rather than in start(), so its storage settings are used below. This comes
+        # after any pre-restore, which loads the user's previous profile, so the one picked for this spawn wins.
+        with timer.phase("load_profile"):
+            await spawner.preload_user_options()
+        storage = await lookup_user_storage(spawner, timer)
+        await volume_from_snapshot(spawner, storage, timer)
+        await server_starting_tag(spawner, storage, timer)
+
+        # Warm a freshly restored home directory once the server is up
+        spawner.apply_home_hydration()
 
     except Exception as e:
+        if isinstance(e, ApiException) and e.status == 429:
+            record_throttle()
+        timer.report(log, outcome="error")
         log.error(e)
         raise
 
+    finally:
+        spawner.end_restore_progress()
+        if admitted:
+            # Phases run with gather overlap, so take the hook's elapsed time rather than summing them
+            wait_ms = sum(timer.phases.get(name, 0.0) for name in WAIT_PHASES)
+            admission.release(max(timer.elapsed_ms - wait_ms, 0.0) / 1000)
+
+    timer.report(log)
 
+
+# Empty volumes kept ready for first-time users. With a size of 0, any left from before are deleted.
+warm_pool = WarmPool(
+    cluster_name=z2jh.get_config("custom.CLUSTER_NAME"),
+    az_name=z2jh.get_config("custom.AZ_NAME"),
+    size_gib=z2jh.get_config("custom.WARM_POOL_VOLUME_GIB", 500),
+    target=z2jh.get_config("custom.WARM_POOL_SIZE", 0),
+    cost_tag_key=z2jh.get_config("custom.COST_TAG_KEY"),
+    cost_tag_value=z2jh.get_config("custom.COST_TAG_VALUE"),
+)
+warm_pool.start()
+
+# Adjust how many pre-spawn hooks run at once from their latency and any throttling
+admission = None
+if z2jh.get_config("custom.SPAWN_ADMISSION_INITIAL", 0):
+    admission = AdmissionController(
+        initial=z2jh.get_config("custom.SPAWN_ADMISSION_INITIAL"),
+        min_limit=z2jh.get_config("custom.SPAWN_ADMISSION_MIN", 1),
+        max_limit=z2jh.get_config("custom.SPAWN_ADMISSION_MAX", 64),
+        target_latency=z2jh.get_config("custom.SPAWN_ADMISSION_TARGET_SECONDS", 10),
+        throttle_count=throttle_count,
+    )
+
+# JupyterHub loads its config with the event loop running, so this runs as soon as the hub is up
+_resume_csi_restores = None
+if restore_mode == "csi":
+    _resume_csi_restores = asyncio.ensure_future(resume_csi_restores())
+
+c.JupyterHub.spawner_class = OSLKubeSpawner
 c.Spawner.pre_spawn_hook = my_pre_hook
+
+# Start restoring returning users' volumes when they log in rather than when they click Start
+if z2jh.get_config("custom.PRE_RESTORE_ON_LOGIN", False):
+    register_restore(prerestore_volume)
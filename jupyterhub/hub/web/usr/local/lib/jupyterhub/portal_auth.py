@@ -10,6 +10,7 @@ from jupyterhub.handlers import BaseHandler
 from jupyterhub.utils import maybe_future
 
 from opensarlab.auth import encryptedjwt
+from oslhub.prerestore import start_prerestore
 
 
 class My403Exception(Exception):
@@ -37,6 +38,16 @@ class PortalAuthLoginHandler(BaseHandler):
     async def post(self):
         raise My401Exception("Not allowed")
 
+    def _start_prerestore(self, user):
+        """
+        If enabled, start restoring the user's volume from a snapshot in the background while they pick a profile.
+        """
+        try:
+            if start_prerestore(user.spawner):
+                self.statsd.incr("login.prerestore")
+        except Exception as e:
+            self.log.error(f"PortalAuth Login pre-restore did not start: {e}")
+
     async def get(self):
         """
         If current JupyterHub user not found, get user info from JWT cookie and login user.
@@ -78,6 +89,8 @@ class PortalAuthLoginHandler(BaseHandler):
                 user = await self.login_user(jwt_data)
 
             if user:
+                self._start_prerestore(user)
+
                 # set new login cookie
                 # because single-user cookie may have been cleared or incorrect
                 self.set_login_cookie(user)
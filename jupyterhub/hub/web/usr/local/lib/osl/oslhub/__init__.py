@@ -0,0 +1,6 @@
+"""
+Shared helpers for the OpenScienceLab hub process.
+
+The files in jupyterhub_config.d are exec'd by z2jh and cannot be imported, so anything they share with
+each other or with the custom handlers lives here. The image puts /usr/local/lib/osl on PYTHONPATH.
+"""
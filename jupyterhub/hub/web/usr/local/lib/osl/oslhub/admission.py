@@ -0,0 +1,121 @@
+"""
+Adaptive admission control for the pre-spawn hook.
+
+JupyterHub's concurrent spawn limit is static, so a class starting at once sends every hook to EC2 and the
+Kubernetes API together whether or not they are keeping up. `AdmissionController` lets `limit` hooks run at
+once and queues the rest in arrival order. The limit follows AIMD: each hook that finishes within
+`target_latency` without any throttling seen grows it by 1/limit, so by about one per round of spawns. A slow
+hook or any AWS or Kubernetes throttling halves it, at most once per `cooldown` seconds.
+
+All methods are called from the hub's event loop.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        target_latency: float = 10.0,
+        throttle_count=None,
+        backoff: float = 0.5,
+        cooldown: float = 10.0,
+    ):
+        """
+        `throttle_count` returns the number of throttling errors seen so far by the hub's clients.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.target_latency = target_latency
+        self.throttle_count = throttle_count
+        self.backoff = backoff
+        self.cooldown = cooldown
+
+        self._active = 0
+        # Future of each queued hook to [position callback, last position reported]
+        self._waiters = collections.OrderedDict()
+        self._last_throttles = throttle_count() if throttle_count else 0
+        self._last_decrease = 0.0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, on_position=None) -> None:
+        """
+        Wait for a slot. While queued, `on_position(n)` is called whenever the hook becomes nth in line.
+        """
+        if not self._waiters and self._active < int(self.limit):
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[future] = [on_position, None]
+        self._notify_positions()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future in self._waiters:
+                del self._waiters[future]
+                self._notify_positions()
+            elif future.done() and not future.cancelled():
+                # Admitted just as the spawn was cancelled, so pass the slot on
+                self._active -= 1
+                self._admit()
+            raise
+
+    def release(self, latency: float) -> None:
+        """
+        Free the slot of a finished hook and adjust the limit from how long its API calls took.
+        """
+        self._active -= 1
+
+        throttled = False
+        if self.throttle_count is not None:
+            throttles = self.throttle_count()
+            throttled = throttles > self._last_throttles
+            self._last_throttles = throttles
+
+        if throttled or latency > self.target_latency:
+            now = time.monotonic()
+            if now - self._last_decrease > self.cooldown:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                log.warning(
+                    f"Spawn admission limit lowered to {int(self.limit)} (throttled: {throttled}, latency: {latency:.1f}s)"
+                )
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+        self._admit()
+
+    def _admit(self) -> None:
+        while self._waiters and self._active < int(self.limit):
+            future, _ = self._waiters.popitem(last=False)
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+        self._notify_positions()
+
+    def _notify_positions(self) -> None:
+        for position, waiter in enumerate(self._waiters.values(), start=1):
+            on_position, last_position = waiter
+            if on_position is not None and position != last_position:
+                waiter[1] = position
+                on_position(position)
@@ -0,0 +1,69 @@
+"""
+Coalesce per-key lookups that arrive close together into one bulk call.
+
+During a spawn storm every pre-spawn hook asks EC2 about its own PVC. `LookupBatcher` holds each request for a
+few milliseconds, then makes one `fetch(keys)` call in the hook executor and hands each waiter its own result.
+With a `Hedger`, a slow `fetch` is hedged with a second one.
+"""
+
+import asyncio
+import logging
+
+from oslhub.executor import run_blocking
+
+log = logging.getLogger(__name__)
+
+
+class LookupBatcher:
+    def __init__(self, fetch, window: float = 0.005, max_batch: int = 100, hedger=None):
+        """
+        `fetch` takes a list of keys and returns a dict of key to a list of results. Keys missing from the
+        dict resolve to an empty list. `max_batch` should stay under the AWS limit of 200 values per filter.
+        """
+        self.fetch = fetch
+        self.window = window
+        self.max_batch = max_batch
+        self.hedger = hedger
+
+        self._pending = {}
+        self._timer = None
+
+    async def get(self, key) -> list:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: dict) -> None:
+        try:
+            if self.hedger is not None:
+                results = await self.hedger.call(self.fetch, list(batch))
+            else:
+                results = await run_blocking(self.fetch, list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        log.debug(f"Batched lookup of {len(batch)} keys")
+        for key, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(list(results.get(key, [])))
@@ -0,0 +1,114 @@
+"""
+Process-wide AWS and Kubernetes clients for the hub hooks.
+
+Building a boto3 client loads the botocore service models and every new client opens its own TLS
+connections. The clients here are built once, on first use, and then shared by every spawn and stop.
+boto3 clients and the Kubernetes ApiClient are safe to share between the hook executor's threads.
+
+Every throttling response the AWS clients get, including those botocore retries on its own, is counted
+in `throttle_count()` for the spawn admission controller.
+"""
+
+import threading
+
+import boto3
+from botocore.config import Config
+from kubernetes import client as k8s_client
+from kubernetes import config as k8s_config
+
+from oslhub.executor import MAX_WORKERS
+
+# One pooled connection per executor thread, kept alive between spawns
+AWS_CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_WORKERS,
+    tcp_keepalive=True,
+    retries={"max_attempts": 5, "mode": "standard"},
+)
+
+THROTTLE_ERROR_CODES = {
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+}
+
+_lock = threading.Lock()
+_aws_clients = {}
+_api_client = None
+_core_v1_api = None
+_custom_objects_api = None
+
+_throttle_lock = threading.Lock()
+_throttles = 0
+
+
+def record_throttle() -> None:
+    global _throttles
+
+    with _throttle_lock:
+        _throttles += 1
+
+
+def throttle_count() -> int:
+    return _throttles
+
+
+def _count_throttle(response=None, **kwargs):
+    # Called by botocore after every attempt. Returning None leaves the retry decision to botocore.
+    if response is not None:
+        code = response[1].get("Error", {}).get("Code")
+        if code in THROTTLE_ERROR_CODES:
+            record_throttle()
+
+
+def get_aws_client(service_name: str, region_name: str):
+    key = (service_name, region_name)
+
+    client = _aws_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _aws_clients.get(key)
+            if client is None:
+                # boto3 sessions are not thread-safe, so each client gets its own under the lock
+                session = boto3.Session(region_name=region_name)
+                client = session.client(service_name, config=AWS_CLIENT_CONFIG)
+                client.meta.events.register("needs-retry", _count_throttle)
+                _aws_clients[key] = client
+
+    return client
+
+
+def _shared_api_client() -> k8s_client.ApiClient:
+    # Called with _lock held. The Kubernetes APIs share one connection pool.
+    global _api_client
+
+    if _api_client is None:
+        configuration = k8s_client.Configuration()
+        k8s_config.load_incluster_config(client_configuration=configuration)
+        configuration.connection_pool_maxsize = MAX_WORKERS
+        _api_client = k8s_client.ApiClient(configuration)
+
+    return _api_client
+
+
+def get_core_v1_api() -> k8s_client.CoreV1Api:
+    global _core_v1_api
+
+    if _core_v1_api is None:
+        with _lock:
+            if _core_v1_api is None:
+                _core_v1_api = k8s_client.CoreV1Api(_shared_api_client())
+
+    return _core_v1_api
+
+
+def get_custom_objects_api() -> k8s_client.CustomObjectsApi:
+    global _custom_objects_api
+
+    if _custom_objects_api is None:
+        with _lock:
+            if _custom_objects_api is None:
+                _custom_objects_api = k8s_client.CustomObjectsApi(_shared_api_client())
+
+    return _custom_objects_api
@@ -0,0 +1,39 @@
+"""
+A dedicated, bounded thread pool for the blocking boto3 and Kubernetes client calls made by the spawner hooks.
+
+The hooks run on the hub's event loop. Sending their blocking calls here keeps logins, the proxy API and
+other spawns responsive while AWS or the Kubernetes API is slow, and lets concurrent spawns overlap.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.environ.get("OSL_HOOK_EXECUTOR_WORKERS", "16"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=MAX_WORKERS,
+                thread_name_prefix="osl-hooks",
+            )
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run `func(*args, **kwargs)` in the hook executor and await its result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
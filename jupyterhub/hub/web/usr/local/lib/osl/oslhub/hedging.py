@@ -0,0 +1,106 @@
+"""
+Hedged calls for read-only lookups on the spawn path.
+
+A small share of EC2 describe calls take seconds instead of milliseconds. `Hedger.call` runs the call in the
+hook executor and, if it hasn't answered after the `percentile` of recent call latencies, sends the same call
+again and takes whichever succeeds first. Only idempotent calls may be hedged.
+
+Every call earns `budget_ratio` of a token and every hedge spends one, so hedges add at most that share of
+extra calls. Up to `max_tokens` are saved for a burst.
+
+All methods are called from the hub's event loop.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+
+from oslhub.executor import run_blocking
+
+log = logging.getLogger(__name__)
+
+
+class Hedger:
+    def __init__(
+        self,
+        percentile: float = 95,
+        budget_ratio: float = 0.1,
+        max_tokens: float = 10,
+        min_delay: float = 0.05,
+        max_delay: float = 2.0,
+        initial_delay: float = 0.5,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.max_tokens = max_tokens
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+
+        self._latencies = collections.deque(maxlen=window)
+        self._tokens = max_tokens
+
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def delay(self) -> float:
+        if len(self._latencies) < self.min_samples:
+            return self.initial_delay
+
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return min(self.max_delay, max(self.min_delay, ordered[index]))
+
+    def _start(self, func, args, kwargs) -> asyncio.Future:
+        started = time.perf_counter()
+        future = asyncio.ensure_future(run_blocking(func, *args, **kwargs))
+
+        def _done(f):
+            if not f.cancelled() and f.exception() is None:
+                self._latencies.append(time.perf_counter() - started)
+
+        future.add_done_callback(_done)
+        return future
+
+    async def call(self, func, *args, **kwargs):
+        self.calls += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.budget_ratio)
+
+        primary = self._start(func, args, kwargs)
+        done, _ = await asyncio.wait({primary}, timeout=self.delay())
+        if done or self._tokens < 1:
+            return await primary
+
+        self._tokens -= 1
+        self.hedges += 1
+        log.debug(
+            f"Hedging {getattr(func, '__name__', func)} after {self.delay():.2f}s"
+        )
+        hedge = self._start(func, args, kwargs)
+
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.hedge_wins += 1
+                    # The loser keeps its executor thread until it returns. Its result is dropped.
+                    for other in pending:
+                        other.add_done_callback(_drop_result)
+                    return future.result()
+
+        # Both failed, so raise the primary's error
+        return primary.result()
+
+
+def _drop_result(future) -> None:
+    if not future.cancelled():
+        future.exception()
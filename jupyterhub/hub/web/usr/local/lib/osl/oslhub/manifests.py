@@ -0,0 +1,180 @@
+"""
+Builders for the PersistentVolume and PersistentVolumeClaim that bind an existing EBS volume to a user, and
+for the VolumeSnapshotContent and VolumeSnapshot that let the EBS CSI driver restore a user's EBS snapshot.
+
+The static parts of the manifests come from the YAML files in etc/. They are parsed once per hub process, so
+the spawn path only fills in the per-volume fields.
+"""
+
+import functools
+import os
+
+import yaml
+from kubernetes import client as k8s_client
+
+ETC_DIR = "/usr/local/etc/jupyterhub/jupyterhub_config.d/etc"
+
+
+@functools.lru_cache(maxsize=None)
+def load_base(file_name: str, etc_dir: str = ETC_DIR) -> dict:
+    with open(os.path.join(etc_dir, file_name), mode="r") as f:
+        return yaml.safe_load(f)
+
+
+def build_persistent_volume(
+    vol_id: str,
+    az_name: str,
+    storage: str,
+    pvc_name: str = None,
+    namespace: str = None,
+    annotations: dict = None,
+    storage_class_name: str = None,
+    name: str = None,
+    reclaim_policy: str = None,
+) -> k8s_client.V1PersistentVolume:
+    """
+    Without `pvc_name` the PV is left unclaimed. The PV is named after the volume unless `name` is given.
+    """
+    base = load_base("pv.yaml")
+    spec = base["spec"]
+    region_name = az_name[:-1]
+
+    return k8s_client.V1PersistentVolume(
+        api_version=base["apiVersion"],
+        kind=base["kind"],
+        metadata=k8s_client.V1ObjectMeta(
+            name=name or vol_id,
+            annotations=dict(annotations or {}),
+            labels={
+                "topology.kubernetes.io/region": region_name,
+                "topology.kubernetes.io/zone": az_name,
+            },
+        ),
+        spec=k8s_client.V1PersistentVolumeSpec(
+            access_modes=list(spec["accessModes"]),
+            aws_elastic_block_store=k8s_client.V1AWSElasticBlockStoreVolumeSource(
+                fs_type=spec["awsElasticBlockStore"]["fsType"],
+                volume_id=f"aws://{az_name}/{vol_id}",
+            ),
+            capacity={"storage": storage},
+            node_affinity=k8s_client.V1VolumeNodeAffinity(
+                required=k8s_client.V1NodeSelector(
+                    node_selector_terms=[
+                        k8s_client.V1NodeSelectorTerm(
+                            match_expressions=[
+                                k8s_client.V1NodeSelectorRequirement(
+                                    key="topology.kubernetes.io/zone",
+                                    operator="In",
+                                    values=[az_name],
+                                ),
+                                k8s_client.V1NodeSelectorRequirement(
+                                    key="topology.kubernetes.io/region",
+                                    operator="In",
+                                    values=[region_name],
+                                ),
+                            ]
+                        )
+                    ]
+                )
+            ),
+            persistent_volume_reclaim_policy=reclaim_policy
+            or spec["persistentVolumeReclaimPolicy"],
+            storage_class_name=storage_class_name or spec["storageClassName"],
+            volume_mode=spec["volumeMode"],
+            claim_ref=(
+                k8s_client.V1ObjectReference(namespace=namespace, name=pvc_name)
+                if pvc_name
+                else None
+            ),
+        ),
+    )
+
+
+def build_persistent_volume_claim(
+    name: str,
+    namespace: str,
+    vol_id: str,
+    storage: str,
+    annotations: dict = None,
+    labels: dict = None,
+    storage_class_name: str = None,
+    snapshot_name: str = None,
+) -> k8s_client.V1PersistentVolumeClaim:
+    """
+    With `snapshot_name` instead of `vol_id`, the CSI driver creates the volume from that VolumeSnapshot.
+    """
+    base = load_base("pvc.yaml")
+    spec = base["spec"]
+
+    data_source = None
+    if snapshot_name:
+        data_source = k8s_client.V1TypedLocalObjectReference(
+            api_group=load_base("volumesnapshot.yaml")["apiVersion"].split("/")[0],
+            kind="VolumeSnapshot",
+            name=snapshot_name,
+        )
+
+    return k8s_client.V1PersistentVolumeClaim(
+        api_version=base["apiVersion"],
+        kind=base["kind"],
+        metadata=k8s_client.V1ObjectMeta(
+            name=name,
+            namespace=namespace,
+            annotations=dict(annotations or {}),
+            labels=dict(labels or {}),
+        ),
+        spec=k8s_client.V1PersistentVolumeClaimSpec(
+            access_modes=list(spec["accessModes"]),
+            resources=k8s_client.V1VolumeResourceRequirements(
+                requests={"storage": storage}
+            ),
+            storage_class_name=storage_class_name or spec["storageClassName"],
+            volume_mode=spec["volumeMode"],
+            volume_name=vol_id,
+            data_source=data_source,
+        ),
+    )
+
+
+def build_volume_snapshot_content(
+    name: str, snapshot_id: str, snapshot_name: str, namespace: str
+) -> dict:
+    """
+    Import an existing EBS snapshot, pre-bound to VolumeSnapshot `snapshot_name` in `namespace`.
+    """
+    base = load_base("volumesnapshotcontent.yaml")
+    spec = base["spec"]
+
+    return {
+        "apiVersion": base["apiVersion"],
+        "kind": base["kind"],
+        "metadata": {"name": name},
+        "spec": {
+            "deletionPolicy": spec["deletionPolicy"],
+            "driver": spec["driver"],
+            "source": {"snapshotHandle": snapshot_id},
+            "volumeSnapshotRef": {"name": snapshot_name, "namespace": namespace},
+        },
+    }
+
+
+def build_volume_snapshot(
+    name: str,
+    namespace: str,
+    content_name: str,
+    labels: dict = None,
+    annotations: dict = None,
+) -> dict:
+    base = load_base("volumesnapshot.yaml")
+
+    return {
+        "apiVersion": base["apiVersion"],
+        "kind": base["kind"],
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "labels": dict(labels or {}),
+            "annotations": dict(annotations or {}),
+        },
+        "spec": {"source": {"volumeSnapshotContentName": content_name}},
+    }
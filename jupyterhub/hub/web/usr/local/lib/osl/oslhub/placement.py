@@ -0,0 +1,97 @@
+"""
+Choose the availability zone for a user's home volume.
+
+EBS snapshots are regional, so a restored volume can be created in any of the cluster's zones. The singleuser pod
+follows its PV's node affinity, so the zone of the volume is also the zone the pod is scheduled in.
+
+Each zone is scored by the number of Ready, schedulable nodes that match the profile's node selector, plus an
+optional weight from the operator's capacity hint. The hint also covers node groups that scale from zero, where
+the node list alone says nothing. A zone is constrained when it scores 0 and another zone doesn't.
+"""
+
+import logging
+import threading
+import time
+
+from oslhub.clients import get_core_v1_api
+
+log = logging.getLogger(__name__)
+
+ZONE_LABEL = "topology.kubernetes.io/zone"
+
+
+class ZonePlacer:
+    def __init__(self, az_names: list, capacity_hint: dict = None, ttl: int = 15):
+        self.az_names = list(az_names)
+        self.capacity_hint = capacity_hint or {}
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._node_counts = {}
+
+    @property
+    def multi_zone(self) -> bool:
+        return len(self.az_names) > 1
+
+    def _count_nodes(self, node_selector: dict) -> dict:
+        """
+        Count the Ready, schedulable nodes matching `node_selector` in each zone.
+
+        Spawns arriving together share one node listing per selector for `ttl` seconds.
+        """
+        label_selector = ",".join(
+            f"{key}={value}" for key, value in sorted((node_selector or {}).items())
+        )
+
+        with self._lock:
+            entry = self._node_counts.get(label_selector)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                return entry[1]
+
+        api = get_core_v1_api()
+        nodes = api.list_node(label_selector=label_selector)
+
+        counts = {az_name: 0 for az_name in self.az_names}
+        for node in nodes.items:
+            zone = (node.metadata.labels or {}).get(ZONE_LABEL)
+            if zone not in counts or node.spec.unschedulable:
+                continue
+            ready = [
+                cond
+                for cond in (node.status.conditions or [])
+                if cond.type == "Ready" and cond.status == "True"
+            ]
+            if ready:
+                counts[zone] += 1
+
+        with self._lock:
+            self._node_counts[label_selector] = (time.monotonic(), counts)
+        return counts
+
+    def scores(self, node_selector: dict) -> dict:
+        counts = self._count_nodes(node_selector)
+        return {
+            az_name: counts.get(az_name, 0) + int(self.capacity_hint.get(az_name, 0))
+            for az_name in self.az_names
+        }
+
+    def choose(self, node_selector: dict) -> str:
+        """
+        Return the zone with the highest score. Ties go to the earliest zone in `az_names`.
+        """
+        if not self.multi_zone:
+            return self.az_names[0]
+
+        scores = self.scores(node_selector)
+        az_name = max(self.az_names, key=lambda az: scores[az])
+        log.info(f"Zone scores {scores}. Placing volume in {az_name}.")
+        return az_name
+
+    def is_constrained(self, node_selector: dict, az_name: str) -> bool:
+        if not self.multi_zone:
+            return False
+
+        scores = self.scores(node_selector)
+        return scores.get(az_name, 0) <= 0 and any(
+            score > 0 for zone, score in scores.items() if zone != az_name
+        )
@@ -0,0 +1,66 @@
+"""
+Volume restores started at portal login, ahead of the user's spawn.
+
+The pre-spawn hook registers its restore coroutine with `register_restore`. The login handler calls
+`start_prerestore` for an arriving user, and the hook calls `adopt_prerestore` before its own lookups, so a
+restore that is still running is awaited instead of started a second time.
+"""
+
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+_restore = None
+_in_flight = {}
+
+
+def register_restore(restore) -> None:
+    """
+    `restore` is an async callable taking the spawner. Pre-restores are off until one is registered.
+    """
+    global _restore
+    _restore = restore
+
+
+def start_prerestore(spawner) -> asyncio.Future:
+    if _restore is None or spawner.active or spawner.pending:
+        return None
+
+    pvc_name = spawner.pvc_name
+
+    task = _in_flight.get(pvc_name)
+    if task is not None:
+        return task
+
+    log.info(f"Starting pre-restore for '{pvc_name}'")
+    task = asyncio.ensure_future(_restore(spawner))
+    _in_flight[pvc_name] = task
+
+    def _done(task):
+        if _in_flight.get(pvc_name) is task:
+            del _in_flight[pvc_name]
+        if not task.cancelled() and task.exception():
+            log.error(f"Pre-restore for '{pvc_name}' failed: {task.exception()}")
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def adopt_prerestore(spawner) -> None:
+    """
+    Wait for an in-flight pre-restore of the spawner's volume. A finished one needs no adopting since its
+    PVC is already in place. A failed one is left for the pre-spawn hook to redo.
+    """
+    task = _in_flight.get(spawner.pvc_name)
+    if task is None:
+        return
+
+    log.info(f"Waiting on the pre-restore for '{spawner.pvc_name}'")
+    try:
+        # Shielded so a cancelled spawn doesn't abandon a half-finished restore
+        await asyncio.shield(task)
+    except Exception as e:
+        log.warning(
+            f"Pre-restore for '{spawner.pvc_name}' did not finish, the pre-spawn hook will restore instead: {e}"
+        )
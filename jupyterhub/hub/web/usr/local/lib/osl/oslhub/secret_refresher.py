@@ -0,0 +1,67 @@
+"""
+Keep a Secrets Manager secret in a file for the hub's authenticator.
+
+The authenticator reads the SSO token from a file. `SecretRefresher.start()` fetches the secret into that file
+at every hub start, so a restarted hub picks up a rotated secret. A daemon thread then fetches it again every
+`interval` seconds. `path` should be on tmpfs or an emptyDir so the secret never lands on a persistent volume.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from oslhub.clients import get_aws_client
+
+log = logging.getLogger(__name__)
+
+
+class SecretRefresher:
+    def __init__(
+        self, secret_id: str, region_name: str, path: str, interval: int = 1800
+    ):
+        self.secret_id = secret_id
+        self.region_name = region_name
+        self.path = path
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def _write(self, value: str) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(value)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self) -> None:
+        secrets_manager = get_aws_client("secretsmanager", self.region_name)
+        value = secrets_manager.get_secret_value(SecretId=self.secret_id)[
+            "SecretString"
+        ]
+        with self._lock:
+            self._write(value)
+        log.info(f"Fetched secret '{self.secret_id}' from Secrets Manager")
+
+    def start(self) -> None:
+        """
+        Fetch the secret now, then again every `interval` seconds in a daemon thread.
+        """
+        if self._refresh_thread:
+            return
+
+        self.refresh()
+
+        def _refresh_loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    log.error(f"Could not refresh secret '{self.secret_id}': {e}")
+
+        self._refresh_thread = threading.Thread(
+            target=_refresh_loop, name="secret-refresh", daemon=True
+        )
+        self._refresh_thread.start()
@@ -0,0 +1,179 @@
+"""
+The hub's spawner class.
+"""
+
+import asyncio
+import time
+
+from kubespawner import KubeSpawner
+from traitlets import Integer, Unicode
+
+# Set in the singleuser environment when the home volume was just restored from a snapshot
+HYDRATE_HOME_ENV = "OSL_HYDRATE_HOME"
+# The volume's provisioned throughput, which tells the hydration script when reads are warm
+HYDRATE_VOLUME_MIBPS_ENV = "OSL_HYDRATE_VOLUME_MIBPS"
+
+# Throughput in MiB/s of a gp3 volume without provisioned throughput
+GP3_BASELINE_MIBPS = 125
+
+
+class OSLKubeSpawner(KubeSpawner):
+    """
+    KubeSpawner with the per-user EBS volume state and settings that the pre-spawn and post-stop hooks use.
+    """
+
+    volume_id = Unicode(
+        "",
+        help="ID of the EBS volume behind the user's PVC, if known. Persisted, and like `pvc_name` kept by "
+        "`clear_state`, so start and stop tagging can go straight to the volume instead of searching by tag.",
+    )
+
+    storage_volume_type = Unicode(
+        "gp3",
+        help="EBS volume type of volumes restored for the user.",
+    ).tag(config=True)
+
+    storage_iops = Integer(
+        None,
+        allow_none=True,
+        help="Provisioned IOPS of volumes restored for the user. None keeps the volume type's baseline.",
+    ).tag(config=True)
+
+    storage_throughput = Integer(
+        None,
+        allow_none=True,
+        help="Provisioned throughput in MiB/s of gp3 volumes restored for the user. None keeps the baseline.",
+    ).tag(config=True)
+
+    golden_snapshot_id = Unicode(
+        "",
+        help="EBS snapshot that first-time users of the profile get their volume created from. Empty for an "
+        "empty volume.",
+    ).tag(config=True)
+
+    def volume_performance(self) -> dict:
+        """
+        Return the `create_volume` arguments for the profile's volume type, IOPS and throughput. The pre-spawn
+        hook applies them to volumes it creates from a snapshot.
+        """
+        performance = {"VolumeType": self.storage_volume_type}
+        if self.storage_iops is not None:
+            performance["Iops"] = self.storage_iops
+        if self.storage_throughput is not None:
+            performance["Throughput"] = self.storage_throughput
+        return performance
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._restore_events = []
+        self._restore_done = True
+        self._restore_changed = asyncio.Event()
+        self._restore_started = 0.0
+        self._user_options_loaded = False
+        self._home_restored = False
+
+    def get_state(self):
+        state = super().get_state()
+        if self.volume_id:
+            state["volume_id"] = self.volume_id
+        return state
+
+    def load_state(self, state):
+        super().load_state(state)
+        if "volume_id" in state:
+            self.volume_id = state["volume_id"]
+
+    async def preload_user_options(self) -> None:
+        """
+        Apply the profile from the pre-spawn hook, before it looks at the volume, so the hook sees the profile's
+        storage settings and `_start` doesn't undo the hook's own changes to the spawner.
+        """
+        await super().load_user_options()
+        self._user_options_loaded = True
+
+    async def load_user_options(self):
+        # Already loaded by the pre-spawn hook for this spawn
+        if self._user_options_loaded:
+            self._user_options_loaded = False
+            return
+        await super().load_user_options()
+
+    async def load_last_user_options(self) -> None:
+        """
+        Apply the profile of the user's last spawn outside of a spawn, such as for a pre-restore at login. The
+        next start still loads its own profile.
+        """
+        await super().load_user_options()
+
+    def mark_home_restored(self) -> None:
+        """
+        A restored volume loads its blocks lazily, so have the next server read its home directory in the
+        background.
+        """
+        self._home_restored = True
+
+    def apply_home_hydration(self) -> None:
+        """
+        Set `OSL_HYDRATE_HOME` for this server if the home volume was restored since the last start, which lets
+        the postStart hook start hydrate_home.py. `OSL_HYDRATE_VOLUME_MIBPS` goes with it.
+        """
+        environment = {
+            key: value
+            for key, value in self.environment.items()
+            if key not in (HYDRATE_HOME_ENV, HYDRATE_VOLUME_MIBPS_ENV)
+        }
+        if self._home_restored:
+            environment[HYDRATE_HOME_ENV] = "1"
+            if self.storage_throughput is not None:
+                environment[HYDRATE_VOLUME_MIBPS_ENV] = str(self.storage_throughput)
+            elif self.storage_volume_type == "gp3":
+                environment[HYDRATE_VOLUME_MIBPS_ENV] = str(GP3_BASELINE_MIBPS)
+            self._home_restored = False
+        self.environment = environment
+
+    def _notify_restore_progress(self) -> None:
+        # Wake every progress() stream that is waiting, then arm a fresh event for the next change
+        self._restore_changed.set()
+        self._restore_changed = asyncio.Event()
+
+    def start_restore_progress(self) -> None:
+        """
+        Begin collecting the pre-spawn hook's `restore_progress` events. `progress` streams them on the spawn
+        page ahead of the pod events.
+        """
+        self._restore_events = []
+        self._restore_done = False
+        self._restore_started = time.perf_counter()
+        self._notify_restore_progress()
+
+    def restore_progress(self, message: str, progress: int = None) -> None:
+        # Outside of a spawn, such as a pre-restore at login, nobody is watching
+        if self._restore_done:
+            return
+
+        elapsed = time.perf_counter() - self._restore_started
+        event = {"message": f"{message} ({elapsed:.1f}s)"}
+        if progress is not None:
+            event["progress"] = progress
+        self._restore_events.append(event)
+        self._notify_restore_progress()
+
+    def end_restore_progress(self) -> None:
+        self._restore_done = True
+        self._notify_restore_progress()
+
+    async def progress(self):
+        # KubeSpawner's pod events start at 30%, so restore events stay below that
+        next_event = 0
+        while True:
+            while next_event < len(self._restore_events):
+                yield self._restore_events[next_event]
+                next_event += 1
+
+            if self._restore_done:
+                break
+
+            await self._restore_changed.wait()
+
+        async for event in super().progress():
+            yield event
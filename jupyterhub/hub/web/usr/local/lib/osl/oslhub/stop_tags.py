@@ -0,0 +1,285 @@
+"""
+Write-behind stop tagging for the post-stop hook.
+
+Tagging each volume as its server stops puts blocking EC2 calls on the hub's event loop, and the idle culler
+stops many servers in one sweep. `StopTagQueue.put` only records a PVC's tags, and a daemon thread flushes them
+every `interval` seconds. PVCs whose volume ID isn't known yet are resolved by the flusher with one
+describe_volumes call per `MAX_LOOKUP` PVCs. Stop times are rounded to the minute, so volumes stopped in the same
+minute get the same tags and each such group goes out as one multi-resource create_tags call. A newer stop of a
+PVC replaces its pending tags.
+
+A lookup or group that fails is retried at the next flush, up to `max_attempts` times. PVCs without exactly one
+volume are dropped, and so are volumes that no longer exist, after one more lookup by PVC name if `put` was
+given the volume ID. Each flush first writes the pending tags to `path`, off the event loop, so a restarted hub
+sends what the last one didn't. Whatever is still pending at interpreter exit is flushed then.
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import botocore.exceptions
+
+from oslhub.clients import get_aws_client
+
+log = logging.getLogger(__name__)
+
+# CreateTags takes up to 1000 resource IDs, and AWS recommends smaller batches, so send half that
+MAX_RESOURCES = 500
+
+# DescribeVolumes takes up to 200 values per filter
+MAX_LOOKUP = 200
+
+PVC_NAME_TAG = "kubernetes.io/created-for/pvc/name"
+
+
+class StopTagQueue:
+    def __init__(
+        self,
+        region_name: str,
+        cluster_name: str,
+        path: str = None,
+        interval: float = 5,
+        max_attempts: int = 5,
+    ):
+        self.region_name = region_name
+        self.cluster_name = cluster_name
+        self.path = path
+        self.interval = interval
+        self.max_attempts = max_attempts
+
+        # PVC name to {"vol_id", "tags", "attempts"}. The volume ID is None until the flusher resolves it.
+        self._pending = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_thread = None
+
+        self._load()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                pending = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error(f"Could not load pending stop tags from {self.path}: {e}")
+            return
+
+        for key, entry in pending.items():
+            # Files written before the queue was keyed by PVC name are keyed by volume ID
+            if "pvc_name" in entry:
+                self._pending[entry["pvc_name"]] = {
+                    "vol_id": key,
+                    "tags": entry["tags"],
+                    "attempts": entry["attempts"],
+                }
+            else:
+                self._pending[key] = entry
+        log.info(f"Loaded {len(self._pending)} pending stop tags from {self.path}")
+
+    def _save(self, pending: dict) -> None:
+        # Called from flush only
+        if not self.path:
+            return
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(pending, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning(f"Could not save pending stop tags to {self.path}: {e}")
+
+    def put(self, pvc_name: str, tags: list, vol_id: str = None) -> None:
+        """
+        Queue `tags` for the volume of `pvc_name`. Pass `vol_id` if it is already known.
+        """
+        with self._lock:
+            self._pending[pvc_name] = {
+                "vol_id": vol_id,
+                "tags": list(tags),
+                "attempts": 0,
+            }
+            self._dirty = True
+
+    def start(self) -> None:
+        if self._flush_thread:
+            return
+
+        def _flush_loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    log.error(f"Could not flush stop tags: {e}")
+
+        self._flush_thread = threading.Thread(
+            target=_flush_loop, name="stop-tag-flusher", daemon=True
+        )
+        self._flush_thread.start()
+        atexit.register(self.flush)
+
+    def _resolve(self, pvc_names: list) -> tuple:
+        """
+        Look up the volumes of `pvc_names`. Returns a dict of PVC name to volume ID, and the PVC names without
+        exactly one volume and those whose lookup failed.
+        """
+        ec2 = get_aws_client("ec2", self.region_name)
+
+        resolved, unknown, failed = {}, [], []
+        for i in range(0, len(pvc_names), MAX_LOOKUP):
+            chunk = pvc_names[i : i + MAX_LOOKUP]
+            try:
+                volumes = []
+                paginator = ec2.get_paginator("describe_volumes")
+                for page in paginator.paginate(
+                    Filters=[
+                        {"Name": f"tag:{PVC_NAME_TAG}", "Values": chunk},
+                        {
+                            "Name": f"tag:kubernetes.io/cluster/{self.cluster_name}",
+                            "Values": ["owned"],
+                        },
+                    ]
+                ):
+                    volumes.extend(page["Volumes"])
+            except Exception as e:
+                log.warning(f"Could not look up the volumes of {len(chunk)} PVCs: {e}")
+                failed.extend(chunk)
+                continue
+
+            by_pvc = {}
+            for volume in volumes:
+                tags = {tag["Key"]: tag["Value"] for tag in volume.get("Tags", [])}
+                by_pvc.setdefault(tags.get(PVC_NAME_TAG), []).append(volume["VolumeId"])
+
+            for pvc_name in chunk:
+                vol_ids = by_pvc.get(pvc_name, [])
+                if len(vol_ids) == 1:
+                    resolved[pvc_name] = vol_ids[0]
+                else:
+                    log.warning(
+                        f"Found {len(vol_ids)} volumes for pvc '{pvc_name}'. Not tagging them."
+                    )
+                    unknown.append(pvc_name)
+
+        return resolved, unknown, failed
+
+    def _create_tags(self, vol_ids: list, tags: list) -> tuple:
+        """
+        Tag `vol_ids` in one call. Returns the volume IDs tagged, missing and failed.
+        """
+        ec2 = get_aws_client("ec2", self.region_name)
+
+        missing = []
+        while vol_ids:
+            try:
+                ec2.create_tags(DryRun=False, Resources=vol_ids, Tags=tags)
+                return vol_ids, missing, []
+            except botocore.exceptions.ClientError as e:
+                if e.response["Error"]["Code"] != "InvalidVolume.NotFound":
+                    log.warning(f"Could not tag {len(vol_ids)} stopped volumes: {e}")
+                    return [], missing, vol_ids
+                message = e.response["Error"].get("Message", "")
+            except Exception as e:
+                log.warning(f"Could not tag {len(vol_ids)} stopped volumes: {e}")
+                return [], missing, vol_ids
+
+            # One missing volume fails the whole call, so drop the ones named and send the rest again
+            gone = set(re.findall(r"vol-[0-9a-f]+", message)) & set(vol_ids)
+            if not gone:
+                if len(vol_ids) == 1:
+                    gone = set(vol_ids)
+                else:
+                    half = len(vol_ids) // 2
+                    first = self._create_tags(vol_ids[:half], tags)
+                    second = self._create_tags(vol_ids[half:], tags)
+                    return (
+                        first[0] + second[0],
+                        missing + first[1] + second[1],
+                        first[2] + second[2],
+                    )
+
+            missing.extend(gone)
+            vol_ids = [vol_id for vol_id in vol_ids if vol_id not in gone]
+
+        return [], missing, []
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                batch = dict(self._pending)
+                dirty, self._dirty = self._dirty, False
+            if dirty:
+                # Saved before sending, so a hub that dies mid-flush still has them
+                self._save(batch)
+            if not batch:
+                return
+
+            resolved, unknown, lookup_failed = self._resolve(
+                [pvc_name for pvc_name, entry in batch.items() if not entry["vol_id"]]
+            )
+            with self._lock:
+                for pvc_name, vol_id in resolved.items():
+                    # Kept on the entry so a retry doesn't look it up again
+                    batch[pvc_name]["vol_id"] = vol_id
+
+            groups = {}
+            vol_pvcs = {}
+            for pvc_name, entry in batch.items():
+                if not entry["vol_id"]:
+                    continue
+                vol_pvcs[entry["vol_id"]] = pvc_name
+                key = tuple(sorted((tag["Key"], tag["Value"]) for tag in entry["tags"]))
+                groups.setdefault(key, []).append(entry["vol_id"])
+
+            tagged, missing, failed = [], [], []
+            for key, vol_ids in groups.items():
+                tags = [{"Key": k, "Value": v} for k, v in key]
+                for i in range(0, len(vol_ids), MAX_RESOURCES):
+                    result = self._create_tags(vol_ids[i : i + MAX_RESOURCES], tags)
+                    tagged.extend(result[0])
+                    missing.extend(result[1])
+                    failed.extend(result[2])
+
+            # A remembered volume ID may be stale, so look the volume up by PVC name at the next flush
+            stale = {vol_pvcs[vol_id] for vol_id in missing} - set(resolved)
+            done = [vol_pvcs[vol_id] for vol_id in tagged + missing] + unknown
+            retry = {vol_pvcs[vol_id] for vol_id in failed} | set(lookup_failed)
+            with self._lock:
+                for pvc_name in stale:
+                    if self._pending.get(pvc_name) is batch[pvc_name]:
+                        batch[pvc_name]["vol_id"] = None
+                        retry.add(pvc_name)
+                for pvc_name in set(done) | retry:
+                    # A newer stop may have replaced the entry while it was being sent
+                    entry = self._pending.get(pvc_name)
+                    if entry is not batch[pvc_name]:
+                        continue
+                    if pvc_name in retry:
+                        entry["attempts"] += 1
+                        if entry["attempts"] < self.max_attempts:
+                            continue
+                        log.error(
+                            f"Giving up on stop tags of '{pvc_name}' after {entry['attempts']} attempts"
+                        )
+                    del self._pending[pvc_name]
+                pending = dict(self._pending)
+                self._dirty = False
+            self._save(pending)
+
+            for vol_id in missing:
+                if vol_pvcs[vol_id] not in stale:
+                    log.warning(f"Volume {vol_id} no longer exists. Not tagging it.")
+            log.info(
+                f"Sent stop tags of {len(tagged)} volumes in {len(groups)} groups. {len(failed) + len(lookup_failed)} failed."
+            )
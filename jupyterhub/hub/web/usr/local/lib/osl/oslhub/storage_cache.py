@@ -0,0 +1,135 @@
+"""
+In-process TTL/LRU cache of EC2 volume and snapshot metadata keyed by PVC name.
+
+The spawner hooks fill it as they look up a user's storage and invalidate a PVC's entries whenever they
+create or tag a volume. `start_warmer` optionally refills it from a periodic bulk listing of the cluster's
+volumes and snapshots, so most hook lookups don't reach AWS. A listing doesn't overwrite a PVC's entries
+invalidated after it started, since it may predate the hook's change.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+VOLUMES = "volumes"
+SNAPSHOTS = "snapshots"
+
+
+class StorageCache:
+    def __init__(self, ttl: int = 600, max_entries: int = 5000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        # (kind, PVC name) to when it was last invalidated
+        self._invalidated = {}
+        self._warmer_thread = None
+
+    def get(self, kind: str, pvc_name: str) -> list:
+        """
+        Return a copy of the cached list, or None if there is no fresh entry.
+        """
+        key = (kind, pvc_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return list(value)
+
+    def _put(self, key: tuple, value: list) -> None:
+        # Called with _lock held
+        self._entries[key] = (time.monotonic(), list(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, kind: str, pvc_name: str, value: list) -> None:
+        with self._lock:
+            self._put((kind, pvc_name), value)
+
+    def put_many(self, kind: str, grouped: dict, listed_at: float = None) -> None:
+        """
+        Cache a listing started at `listed_at`, a `time.monotonic()` value, skipping the PVCs invalidated since.
+        """
+        with self._lock:
+            for pvc_name, value in grouped.items():
+                key = (kind, pvc_name)
+                invalidated_at = self._invalidated.get(key)
+                if (
+                    listed_at is not None
+                    and invalidated_at is not None
+                    and invalidated_at >= listed_at
+                ):
+                    continue
+                self._put(key, value)
+
+            if listed_at is not None:
+                # Listings only start later from here on, so older invalidations can't matter
+                self._invalidated = {
+                    key: invalidated_at
+                    for key, invalidated_at in self._invalidated.items()
+                    if key[0] != kind or invalidated_at >= listed_at
+                }
+
+    def invalidate(self, pvc_name: str, kind: str = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for k in [kind] if kind else [VOLUMES, SNAPSHOTS]:
+                self._entries.pop((k, pvc_name), None)
+                # Only the warmer's listings need the time, and it prunes them
+                if self._warmer_thread:
+                    self._invalidated[(k, pvc_name)] = now
+
+    def start_warmer(self, interval: int, list_storage) -> None:
+        """
+        Every `interval` seconds, call `list_storage()` in a daemon thread and cache what it returns.
+        `list_storage` returns a pair of dicts, volumes and snapshots, each keyed by PVC name.
+        """
+        if self._warmer_thread:
+            return
+
+        def _warm_loop():
+            while True:
+                try:
+                    listed_at = time.monotonic()
+                    volumes, snapshots = list_storage()
+                    self.put_many(VOLUMES, volumes, listed_at)
+                    self.put_many(SNAPSHOTS, snapshots, listed_at)
+                    log.info(
+                        f"Warmed storage cache with {len(volumes)} volume and {len(snapshots)} snapshot entries"
+                    )
+                except Exception as e:
+                    log.error(f"Could not warm storage cache: {e}")
+                time.sleep(interval)
+
+        self._warmer_thread = threading.Thread(
+            target=_warm_loop, name="storage-cache-warmer", daemon=True
+        )
+        self._warmer_thread.start()
+
+
+_storage_cache = None
+_storage_cache_lock = threading.Lock()
+
+
+def get_storage_cache(ttl: int = 600, max_entries: int = 5000) -> StorageCache:
+    """
+    Return the hub's one StorageCache. The settings of the first call win.
+    """
+    global _storage_cache
+
+    with _storage_cache_lock:
+        if _storage_cache is None:
+            _storage_cache = StorageCache(ttl=ttl, max_entries=max_entries)
+    return _storage_cache
@@ -0,0 +1,63 @@
+"""
+Per-phase timings for the spawner hooks.
+
+Each phase is sent to the hub's statsd client as a timing, and `report()` writes every phase of one hook
+run as a single JSON log line, so "why was this spawn slow" can be answered from either place.
+"""
+
+import contextlib
+import json
+import time
+
+
+class PhaseTimer:
+    def __init__(self, statsd=None, prefix: str = "hook", **labels):
+        self.statsd = statsd
+        self.prefix = prefix
+        self.labels = dict(labels)
+        self.phases = {}
+        self._started = time.perf_counter()
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def label(self, **labels) -> None:
+        self.labels.update(labels)
+
+    def _record(self, name: str, elapsed_ms: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+        if self.statsd is not None:
+            self.statsd.timing(f"{self.prefix}.{name}", elapsed_ms)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, (time.perf_counter() - started) * 1000)
+
+    async def measure(self, name: str, awaitable):
+        """
+        Await `awaitable` as phase `name`. Useful for timing each of several awaitables run with gather.
+        """
+        with self.phase(name):
+            return await awaitable
+
+    def report(self, log, outcome: str = "ok") -> None:
+        total_ms = self.elapsed_ms
+        if self.statsd is not None:
+            self.statsd.timing(f"{self.prefix}.total", total_ms)
+
+        log.info(
+            json.dumps(
+                {
+                    "event": self.prefix,
+                    "outcome": outcome,
+                    **self.labels,
+                    "total_ms": round(total_ms, 1),
+                    "phases_ms": {k: round(v, 1) for k, v in self.phases.items()},
+                }
+            )
+        )
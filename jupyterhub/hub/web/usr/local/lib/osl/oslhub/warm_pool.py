@@ -0,0 +1,282 @@
+"""
+A pool of empty, pre-created home volumes for first-time users.
+
+The controller thread keeps `target` gp3 volumes of `size_gib` available in the hub's AZ, each with an unbound
+PV named `warm-pool-<volume ID>` in the `warm-pool` storage class. No StorageClass of that name exists, so
+Kubernetes never binds these PVs on its own, and they are Retain so deleting one never deletes its volume. A
+first-time user's pre-spawn hook calls `claim`, which deletes the pool PV, retags the EBS volume for the user's
+PVC and hands back the volume ID. The hook then binds the volume to a new PV named after the volume, with the
+usual Delete policy, like a restored one, and the controller refills the pool in the background.
+
+Every refill also reconciles EC2 with Kubernetes. A pool volume without a pool PV, left by a hub that stopped
+between creating the volume and its PV or between deleting the PV and retagging the volume, is adopted back
+into the pool or deleted. Volumes above `target` or of another size, such as after the pool settings change,
+are deleted. With a `target` of 0 the pool is reconciled once at start, which empties it.
+"""
+
+import logging
+import threading
+import time
+
+from kubernetes.client.rest import ApiException
+
+from oslhub.clients import get_aws_client, get_core_v1_api
+from oslhub.manifests import build_persistent_volume
+
+log = logging.getLogger(__name__)
+
+POOL_KEY = "osl-warm-pool"
+POOL_STORAGE_CLASS = "warm-pool"
+POOL_PV_PREFIX = "warm-pool-"
+
+# A claimed volume can still be tagged `available` for a moment after its pool PV is gone
+CLAIM_GRACE_SECONDS = 600
+
+
+def _pool_volume_id(pv) -> str:
+    return pv.spec.aws_elastic_block_store.volume_id.split("/")[-1]
+
+
+class WarmPool:
+    def __init__(
+        self,
+        cluster_name: str,
+        az_name: str,
+        size_gib: int,
+        target: int,
+        cost_tag_key: str,
+        cost_tag_value: str,
+        interval: int = 60,
+    ):
+        self.cluster_name = cluster_name
+        self.az_name = az_name
+        self.size_gib = size_gib
+        self.target = target
+        self.cost_tag_key = cost_tag_key
+        self.cost_tag_value = cost_tag_value
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        # Volume ID to when it was claimed, so the reconciler leaves it alone
+        self._claimed = {}
+        self._refill_thread = None
+
+    def _pool_pvs(self) -> list:
+        api = get_core_v1_api()
+        pvs = api.list_persistent_volume(label_selector=f"{POOL_KEY}=available")
+        return [pv for pv in pvs.items if pv.metadata.name.startswith(POOL_PV_PREFIX)]
+
+    def _available_pvs(self) -> list:
+        return [
+            pv
+            for pv in self._pool_pvs()
+            if pv.status.phase == "Available"
+            and pv.spec.claim_ref is None
+            and pv.metadata.deletion_timestamp is None
+            and pv.spec.capacity.get("storage") == f"{self.size_gib}Gi"
+        ]
+
+    def _pool_volumes(self) -> list:
+        ec2 = get_aws_client("ec2", self.az_name[:-1])
+
+        volumes = []
+        paginator = ec2.get_paginator("describe_volumes")
+        for page in paginator.paginate(
+            Filters=[
+                {"Name": f"tag:{POOL_KEY}", "Values": ["available"]},
+                {
+                    "Name": f"tag:kubernetes.io/cluster/{self.cluster_name}",
+                    "Values": ["owned"],
+                },
+            ]
+        ):
+            volumes.extend(page["Volumes"])
+        return volumes
+
+    def _create_pv(self, vol_id: str) -> None:
+        api = get_core_v1_api()
+
+        pv = build_persistent_volume(
+            vol_id=vol_id,
+            az_name=self.az_name,
+            storage=f"{self.size_gib}Gi",
+            storage_class_name=POOL_STORAGE_CLASS,
+            name=f"{POOL_PV_PREFIX}{vol_id}",
+            reclaim_policy="Retain",
+        )
+        pv.metadata.labels[POOL_KEY] = "available"
+        api.create_persistent_volume(body=pv)
+
+    def _add_volume(self) -> str:
+        ec2 = get_aws_client("ec2", self.az_name[:-1])
+
+        vol = ec2.create_volume(
+            AvailabilityZone=self.az_name,
+            Encrypted=False,
+            Size=self.size_gib,
+            VolumeType="gp3",
+            TagSpecifications=[
+                {
+                    "ResourceType": "volume",
+                    "Tags": [
+                        {"Key": "Name", "Value": f"warm-pool-{self.cluster_name}"},
+                        {
+                            "Key": f"kubernetes.io/cluster/{self.cluster_name}",
+                            "Value": "owned",
+                        },
+                        {"Key": POOL_KEY, "Value": "available"},
+                        {"Key": self.cost_tag_key, "Value": self.cost_tag_value},
+                    ],
+                },
+            ],
+        )
+        vol_id = vol["VolumeId"]
+        ec2.get_waiter("volume_available").wait(VolumeIds=[vol_id])
+        self._create_pv(vol_id)
+
+        log.info(f"Added volume {vol_id} to the warm pool")
+        return vol_id
+
+    def _remove_volume(self, vol_id: str, pv_name: str = None) -> None:
+        api = get_core_v1_api()
+        ec2 = get_aws_client("ec2", self.az_name[:-1])
+
+        if pv_name:
+            try:
+                api.delete_persistent_volume(name=pv_name)
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+        ec2.delete_volume(VolumeId=vol_id)
+        log.info(f"Removed volume {vol_id} from the warm pool")
+
+    def reconcile(self) -> int:
+        """
+        Adopt or delete pool volumes that have no pool PV, and trim the pool down to `target`. Returns the
+        number of pool volumes available afterwards.
+        """
+        # Volumes are listed before PVs, so a PV made in between is still seen
+        volumes = self._pool_volumes()
+        pvs = self._pool_pvs()
+        pv_volume_ids = {_pool_volume_id(pv) for pv in pvs}
+
+        with self._lock:
+            now = time.monotonic()
+            self._claimed = {
+                vol_id: claimed_at
+                for vol_id, claimed_at in self._claimed.items()
+                if now - claimed_at < CLAIM_GRACE_SECONDS
+            }
+            claimed = set(self._claimed)
+
+        available = self._available_pvs()
+        count = len(available)
+
+        for volume in volumes:
+            vol_id = volume["VolumeId"]
+            if vol_id in pv_volume_ids or vol_id in claimed:
+                continue
+
+            if (
+                count < self.target
+                and volume["State"] == "available"
+                and volume["Size"] == self.size_gib
+                and volume["AvailabilityZone"] == self.az_name
+            ):
+                self._create_pv(vol_id)
+                count += 1
+                log.info(f"Adopted orphaned volume {vol_id} back into the warm pool")
+            elif volume["State"] == "available":
+                self._remove_volume(vol_id)
+
+        available_names = {pv.metadata.name for pv in available}
+        for pv in pvs:
+            if (
+                pv.metadata.name not in available_names
+                and pv.status.phase == "Available"
+                and pv.metadata.deletion_timestamp is None
+            ):
+                self._remove_volume(_pool_volume_id(pv), pv.metadata.name)
+
+        api = get_core_v1_api()
+        for pv in available[max(self.target, 0) :]:
+            vol_id = _pool_volume_id(pv)
+            # The PV is deleted under the lock, so a claim can't take the volume at the same time
+            with self._lock:
+                if vol_id in self._claimed:
+                    continue
+                try:
+                    api.delete_persistent_volume(name=pv.metadata.name)
+                except ApiException as e:
+                    if e.status == 404:
+                        continue
+                    raise
+            self._remove_volume(vol_id)
+            count -= 1
+
+        return count
+
+    def refill(self) -> None:
+        missing = self.target - self.reconcile()
+        for _ in range(max(missing, 0)):
+            self._add_volume()
+
+    def claim(self, size_gib: int, tags: list) -> str:
+        """
+        Take a pool volume of exactly `size_gib` and retag it with `tags`. Returns the volume ID, or None if
+        the pool has no volume of that size.
+        """
+        if size_gib != self.size_gib:
+            return None
+
+        api = get_core_v1_api()
+        ec2 = get_aws_client("ec2", self.az_name[:-1])
+
+        # Only choosing and deleting the PV is serialized. The hook's PV has a different name, so nothing
+        # waits for the deletion to finish.
+        with self._lock:
+            for pv in self._available_pvs():
+                vol_id = _pool_volume_id(pv)
+                if vol_id in self._claimed:
+                    continue
+                try:
+                    # The pool PV is Retain, so the EBS volume stays
+                    api.delete_persistent_volume(name=pv.metadata.name)
+                except ApiException as e:
+                    if e.status == 404:
+                        continue
+                    raise
+                self._claimed[vol_id] = time.monotonic()
+                break
+            else:
+                return None
+
+        ec2.create_tags(
+            Resources=[vol_id],
+            Tags=tags + [{"Key": POOL_KEY, "Value": "claimed"}],
+        )
+
+        log.info(f"Claimed warm pool volume {vol_id}")
+        return vol_id
+
+    def start(self) -> None:
+        """
+        Refill the pool every `interval` seconds in a daemon thread. Without a target, only clean it up once.
+        """
+        if self._refill_thread:
+            return
+
+        def _refill_loop():
+            while True:
+                try:
+                    self.refill()
+                except Exception as e:
+                    log.error(f"Could not refill the warm pool: {e}")
+                if self.target <= 0:
+                    return
+                time.sleep(self.interval)
+
+        self._refill_thread = threading.Thread(
+            target=_refill_loop, name="warm-pool", daemon=True
+        )
+        self._refill_thread.start()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Warm a home directory whose volume was just restored from an EBS snapshot.
+
+A restored volume fetches each block from S3 the first time it is read, so the first conda import or GeoTIFF
+read after a restore is slow. This reads the files most likely to be needed first, `.local` and then the most
+recently modified, at idle CPU and IO priority in a small thread pool. It stops when everything has been read,
+when the byte budget is spent, or when reads show the volume is already warm.
+
+Progress is logged and written as JSON to OSL_HYDRATE_STATUS_FILE.
+
+Started in the background from the postStart hook when the hub sets OSL_HYDRATE_HOME.
+"""
+
+import json
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+logging.basicConfig(
+    format="%(asctime)s %(levelname)s (%(lineno)d) - %(message)s", level=logging.INFO
+)
+log = logging.getLogger(__name__)
+
+HOME = os.environ.get("OSL_HYDRATE_ROOT", "/home/jovyan")
+STATUS_FILE = os.environ.get("OSL_HYDRATE_STATUS_FILE", "/tmp/hydrate_home.json")
+WORKERS = int(os.environ.get("OSL_HYDRATE_WORKERS", "8"))
+MAX_BYTES = int(os.environ.get("OSL_HYDRATE_MAX_GIB", "50")) * 2**30
+
+# Provisioned throughput of the volume in MiB/s, set by the hub. 125 is the gp3 baseline.
+VOLUME_MIBPS = int(os.environ.get("OSL_HYDRATE_VOLUME_MIBPS", "125"))
+
+# Reads faster than this (MiB/s) over WARM_WINDOWS windows in a row mean the blocks are already local. Blocks
+# still in S3 come in well below what the volume is provisioned for.
+WARM_MIBPS = int(os.environ.get("OSL_HYDRATE_WARM_MIBPS", VOLUME_MIBPS * 4 // 5))
+WARM_WINDOWS = 3
+WINDOW_BYTES = 256 * 2**20
+
+CHUNK_SIZE = 2**20
+
+# Read before everything else, in this order
+PRIORITY_DIRS = [".local", ".conda", ".ipython", ".jupyter"]
+
+# Pages of files at least this big are dropped after reading so a large dataset doesn't push the user's working
+# set out of the page cache. Files in PRIORITY_DIRS are kept, since they are about to be imported.
+DROP_CACHE_BYTES = 64 * 2**20
+
+
+def lower_priority() -> None:
+    os.nice(19)
+    if shutil.which("ionice"):
+        subprocess.run(
+            ["ionice", "-c", "3", "-p", str(os.getpid())],
+            check=False,
+            capture_output=True,
+        )
+
+
+def list_files(root: str) -> list:
+    """
+    Return (path, size) of every regular file under `root`, priority directories first, then newest first.
+    """
+
+    def walk(top):
+        files = []
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                st = entry.stat(follow_symlinks=False)
+                                files.append((st.st_mtime, entry.path, st.st_size))
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+        return files
+
+    ordered = []
+    seen = set()
+    for name in PRIORITY_DIRS:
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            files = walk(path)
+            files.sort(reverse=True)
+            ordered.extend(files)
+            seen.add(path)
+
+    rest = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.path in seen:
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    rest.extend(walk(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    rest.append((st.st_mtime, entry.path, st.st_size))
+            except OSError:
+                pass
+    rest.sort(reverse=True)
+    ordered.extend(rest)
+
+    return [(path, size) for _, path, size in ordered]
+
+
+class Hydrator:
+    def __init__(self, files: list):
+        self.files = files
+        self._priority_roots = tuple(
+            os.path.join(HOME, name) + os.sep for name in PRIORITY_DIRS
+        )
+        self.total_bytes = min(sum(size for _, size in files), MAX_BYTES)
+
+        self._queue = queue.Queue()
+        for item in files:
+            self._queue.put(item)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stop_reason = "done"
+
+        self.files_read = 0
+        self.bytes_read = 0
+        self.started = time.monotonic()
+
+        self._window_start = self.started
+        self._window_bytes = 0
+        self._fast_windows = 0
+
+    def _account(self, n: int) -> None:
+        with self._lock:
+            self.bytes_read += n
+            self._window_bytes += n
+
+            if self.bytes_read >= MAX_BYTES:
+                self.stop_reason = "budget"
+                self._stop.set()
+
+            if self._window_bytes >= WINDOW_BYTES:
+                now = time.monotonic()
+                mibps = self._window_bytes / 2**20 / max(now - self._window_start, 1e-6)
+                self._fast_windows = self._fast_windows + 1 if mibps > WARM_MIBPS else 0
+                self._window_start = now
+                self._window_bytes = 0
+
+                if self._fast_windows >= WARM_WINDOWS:
+                    self.stop_reason = "warm"
+                    self._stop.set()
+
+    def _read(self, path: str, size: int) -> None:
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        except OSError:
+            return
+
+        try:
+            while not self._stop.is_set():
+                data = os.read(fd, CHUNK_SIZE)
+                if not data:
+                    break
+                self._account(len(data))
+
+            # The goal is to pull the blocks onto the volume, not to fill the pod's page cache
+            if size >= DROP_CACHE_BYTES and not path.startswith(self._priority_roots):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+        with self._lock:
+            self.files_read += 1
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                path, size = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self._read(path, size)
+
+    def status(self, state: str) -> dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            "state": state,
+            "files_read": self.files_read,
+            "files_total": len(self.files),
+            "bytes_read": self.bytes_read,
+            "bytes_total": self.total_bytes,
+            "percent": round(100 * self.bytes_read / max(self.total_bytes, 1), 1),
+            "elapsed_s": round(elapsed, 1),
+            "mib_per_s": round(self.bytes_read / 2**20 / max(elapsed, 1e-6), 1),
+        }
+
+    def write_status(self, state: str) -> dict:
+        status = self.status(state)
+        try:
+            tmp_path = f"{STATUS_FILE}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(status, f)
+            os.replace(tmp_path, STATUS_FILE)
+        except OSError as e:
+            log.warning(f"Could not write hydration status: {e}")
+        return status
+
+    def run(self, report_interval: int = 30) -> dict:
+        threads = [
+            threading.Thread(target=self._worker, daemon=True) for _ in range(WORKERS)
+        ]
+        for thread in threads:
+            thread.start()
+
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=report_interval / len(threads))
+            log.info(f"Hydrating home directory: {self.write_status('running')}")
+
+        status = self.write_status(self.stop_reason)
+        log.info(f"Home directory hydration finished ({self.stop_reason}): {status}")
+        return status
+
+
+def main():
+    lower_priority()
+
+    files = list_files(HOME)
+    log.info(
+        f"Hydrating {len(files)} files under {HOME} with {WORKERS} workers, warm above {WARM_MIBPS} MiB/s..."
+    )
+
+    Hydrator(files).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -36,6 +36,15 @@ python3 create_crons.py \
     --cluster_name=${COST_TAG_VALUE}-cluster ;
 yamllint -c $OSL_HOME/.yamllint $OSL_HOME/services/crons/k8s/crons.yaml;
 
+echo "Render storage_metrics.yaml...";
+python3 create_crons.py \
+    --config $OSL_HOME/opensciencelab.yaml \
+    --template_path $OSL_HOME/services/storage_metrics/k8s/storage_metrics.yaml.jinja \
+    --output_file $OSL_HOME/services/storage_metrics/k8s/storage_metrics.yaml \
+    --region_name ${AWS_REGION} \
+    --cluster_name=${COST_TAG_VALUE}-cluster ;
+yamllint -c $OSL_HOME/.yamllint $OSL_HOME/services/storage_metrics/k8s/storage_metrics.yaml;
+
 echo "Render singleuser scripts...";
 python3 create_singleuser_scripts.py \
     --origin_singleuser_scripts_dir=$OSL_HOME/singleuser/ \
@@ -52,6 +61,13 @@ python3 create_dask_config.py \
     --template_path $OSL_HOME/pipeline/configs/dask_config.yaml.j2 \
     --output_file $OSL_HOME/pipeline/configs/dask_config.yaml
 
+echo "Render csi-sc-tiers.yaml...";
+python3 create_dask_config.py \
+    --config $OSL_HOME/opensciencelab.yaml \
+    --template_path $OSL_HOME/pipeline/configs/csi-sc-tiers.yaml.j2 \
+    --output_file $OSL_HOME/pipeline/configs/csi-sc-tiers.yaml
+yamllint -c $OSL_HOME/.yamllint $OSL_HOME/pipeline/configs/csi-sc-tiers.yaml;
+
 echo "Render files within jupyterhub_config.d...";
 python3 create_config_d.py \
     --config $OSL_HOME/opensciencelab.yaml \
@@ -35,7 +35,11 @@ def check_parameters(config):
         "dask_helm_version"
     ]
 
-    optional_fields = []
+    optional_fields = [
+        "combined_lifecycle_cron",
+        "restore_mode",
+        "external_snapshotter_version",
+    ]
 
     for required in required_fields:
         if required not in params.keys():
@@ -106,6 +110,20 @@ def check_parameters(config):
         if optional in params.keys():
             print(f"Optional field '{optional}' found.")
 
+            if optional == "combined_lifecycle_cron":
+                value = params["combined_lifecycle_cron"]
+                if type(value) != bool:
+                    raise Exception(
+                        f"Value for 'combined_lifecycle_cron' is '{ params['combined_lifecycle_cron'] }' and must be True or False."
+                    )
+
+            elif optional == "restore_mode":
+                value = params["restore_mode"]
+                if value not in ("ec2", "csi"):
+                    raise Exception(
+                        f"Value for 'restore_mode' is '{ params['restore_mode'] }' and must be ec2 or csi."
+                    )
+
 
 def check_nodes(config):
     required_fields = ["name", "instance", "min_number", "max_number", "node_policy"]
@@ -226,6 +244,10 @@ def check_lab_profiles(config):
         "service_account",
         "desktop",
         "egress_profile",
+        "storage_volume_type",
+        "storage_iops",
+        "storage_throughput",
+        "golden_snapshot_id",
     ]
 
     for lab_profile in config["lab_profiles"]:
@@ -253,6 +275,67 @@ def check_lab_profiles(config):
                 f"Service account name '{lab_profile['service_account']}' is not valid for lab profile '{ lab_profile['name'] }'. Must be one of '{all_service_accounts}'."
             )
 
+        # Check to see if the golden snapshot id is well formed
+        golden_snapshot_id = lab_profile.get("golden_snapshot_id", "")
+        if golden_snapshot_id and not re.fullmatch(r"snap-[0-9a-f]{8,17}", str(golden_snapshot_id)):
+            raise Exception(
+                f"Value for 'golden_snapshot_id' is '{golden_snapshot_id}' for lab profile '{ lab_profile['name'] }' and must be an EBS snapshot id (snap-0123456789abcdef0)."
+            )
+
+        check_storage_performance(lab_profile)
+
+
+# Provisioned IOPS and throughput (MiB/s) ranges allowed by EBS for each volume type
+STORAGE_IOPS_RANGES = {
+    "gp3": (3000, 16000),
+    "io1": (100, 64000),
+    "io2": (100, 256000),
+}
+STORAGE_THROUGHPUT_RANGES = {
+    "gp3": (125, 1000),
+}
+
+
+def check_storage_performance(lab_profile):
+    volume_type = lab_profile.get("storage_volume_type", "gp3")
+    iops = lab_profile.get("storage_iops", None)
+    throughput = lab_profile.get("storage_throughput", None)
+
+    if volume_type not in STORAGE_IOPS_RANGES:
+        raise Exception(
+            f"Value for 'storage_volume_type' is '{volume_type}' for lab profile '{ lab_profile['name'] }' and must be one of '{list(STORAGE_IOPS_RANGES)}'."
+        )
+
+    if iops is None and volume_type != "gp3":
+        raise Exception(
+            f"Lab profile '{ lab_profile['name'] }' has storage_volume_type '{volume_type}' and must also have 'storage_iops'."
+        )
+
+    if iops is not None:
+        low, high = STORAGE_IOPS_RANGES[volume_type]
+        if type(iops) != int or not low <= iops <= high:
+            raise Exception(
+                f"Value for 'storage_iops' is '{iops}' for lab profile '{ lab_profile['name'] }' and must be an integer between {low} and {high} for '{volume_type}'."
+            )
+
+    if throughput is not None:
+        if volume_type not in STORAGE_THROUGHPUT_RANGES:
+            raise Exception(
+                f"Lab profile '{ lab_profile['name'] }' sets 'storage_throughput', which is only allowed for '{list(STORAGE_THROUGHPUT_RANGES)}' volumes."
+            )
+        low, high = STORAGE_THROUGHPUT_RANGES[volume_type]
+        if type(throughput) != int or not low <= throughput <= high:
+            raise Exception(
+                f"Value for 'storage_throughput' is '{throughput}' for lab profile '{ lab_profile['name'] }' and must be an integer between {low} and {high}."
+            )
+
+        # gp3 allows at most 0.25 MiB/s of throughput per provisioned IOPS
+        max_throughput = (iops or STORAGE_IOPS_RANGES["gp3"][0]) // 4
+        if throughput > max_throughput:
+            raise Exception(
+                f"Value for 'storage_throughput' is '{throughput}' for lab profile '{ lab_profile['name'] }' and must be at most {max_throughput} for {iops or 'baseline'} IOPS."
+            )
+
 
 def main(config):
     with open(config, "r") as infile:
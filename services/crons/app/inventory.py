@@ -0,0 +1,127 @@
+"""
+A single listing of the lab's user volumes and snapshots.
+
+The volume and snapshot crons used to issue their own `describe_volumes` and
+`describe_snapshots` calls, often once per resource. `StorageInventory` lists
+everything once per run and answers the per-PVC questions from memory.
+
+"""
+
+import logging
+from datetime import datetime, timezone, timedelta
+
+log = logging.getLogger(__name__)
+
+PVC_NAME_TAG = "kubernetes.io/created-for/pvc/name"
+
+
+def get_tag_value(resource: dict, key: str) -> str:
+    val = [v["Value"] for v in resource.get("Tags", []) if v["Key"] == key]
+
+    if not val:
+        val = [""]
+
+    return str(val[0])
+
+
+class StorageInventory:
+    def __init__(self, ec2, cluster_name: str):
+        self.ec2 = ec2
+        self.cluster_name = cluster_name
+
+        self.volumes = []
+        self.snapshots = []
+        self._volumes_by_pvc = {}
+        self._snapshots_by_pvc = {}
+        self._snapshots_listed_at = None
+
+    def _cluster_filters(self) -> list:
+        return [
+            {
+                "Name": "tag:kubernetes.io/cluster/{0}".format(self.cluster_name),
+                "Values": ["owned"],
+            },
+            {"Name": f"tag:{PVC_NAME_TAG}", "Values": ["*"]},
+        ]
+
+    def list_volumes(self) -> list:
+        volumes = []
+        paginator = self.ec2.get_paginator("describe_volumes")
+        for page in paginator.paginate(Filters=self._cluster_filters()):
+            volumes.extend(page["Volumes"])
+        return volumes
+
+    def list_snapshots(self, extra_filters: list = None) -> list:
+        snapshots = []
+        paginator = self.ec2.get_paginator("describe_snapshots")
+        for page in paginator.paginate(
+            Filters=self._cluster_filters()
+            + [{"Name": "status", "Values": ["completed"]}]
+            + (extra_filters or []),
+            OwnerIds=["self"],
+        ):
+            snapshots.extend(page["Snapshots"])
+        return snapshots
+
+    def refresh(self) -> None:
+        """
+        List all volumes (in any state) and all completed snapshots of the cluster that carry a PVC name tag.
+        """
+        self._snapshots_listed_at = datetime.now(timezone.utc)
+        self.volumes = self.list_volumes()
+        self.snapshots = self.list_snapshots()
+        self._index()
+
+    def refresh_incremental(self) -> None:
+        """
+        Re-list all volumes since their tags change on every server start and stop.
+        Only list snapshots started since the last listing and merge them in. Snapshots deleted in the meantime are dropped on the next full `refresh()`.
+        """
+        if not self._snapshots_listed_at:
+            self.refresh()
+            return
+
+        now = datetime.now(timezone.utc)
+        since = self._snapshots_listed_at.date()
+        days = [since + timedelta(days=d) for d in range((now.date() - since).days + 1)]
+
+        self._snapshots_listed_at = now
+        self.volumes = self.list_volumes()
+        new_snapshots = self.list_snapshots(
+            extra_filters=[
+                {
+                    "Name": "start-time",
+                    "Values": [f"{day.isoformat()}*" for day in days],
+                }
+            ]
+        )
+
+        snapshots = {snap["SnapshotId"]: snap for snap in self.snapshots}
+        for snap in new_snapshots:
+            snapshots[snap["SnapshotId"]] = snap
+        self.snapshots = list(snapshots.values())
+        self._index()
+
+    def _index(self) -> None:
+        self._volumes_by_pvc = {}
+        for vol in self.volumes:
+            pvc_name = get_tag_value(vol, PVC_NAME_TAG)
+            self._volumes_by_pvc.setdefault(pvc_name, []).append(vol)
+
+        self._snapshots_by_pvc = {}
+        for snap in self.snapshots:
+            pvc_name = get_tag_value(snap, PVC_NAME_TAG)
+            self._snapshots_by_pvc.setdefault(pvc_name, []).append(snap)
+
+        log.info(
+            f"Inventory for '{self.cluster_name}': {len(self.volumes)} volumes, {len(self.snapshots)} snapshots"
+        )
+
+    def available_volumes(self) -> list:
+        return [v for v in self.volumes if v["State"] == "available"]
+
+    def volumes_for_pvc(self, pvc_name: str) -> list:
+        return list(self._volumes_by_pvc.get(pvc_name, []))
+
+    def snapshots_for_pvc(self, pvc_name: str) -> list:
+        return list(self._snapshots_by_pvc.get(pvc_name, []))
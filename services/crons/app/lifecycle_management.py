@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""
+Run the volume and snapshot lifecycle checks in one process.
+
+The AWS session, Kubernetes client, SSO token and EC2 inventory are created once and shared by both. The
+volumes are listed again between the two checks.
+Volumes are checked first since deleting expired volumes only ever needs a snapshot to still exist.
+
+"""
+
+import argparse
+import logging
+
+import boto3
+from kubernetes import client as k8s_client
+from kubernetes import config as k8s_config
+
+from inventory import StorageInventory
+from secret_provider import SecretProvider
+from volume_management import delete_volumes
+from snapshot_management import SnapshotManagement
+
+logging.basicConfig(
+    format="%(asctime)s %(levelname)s (%(lineno)d) - %(message)s", level=logging.INFO
+)
+log = logging.getLogger(__name__)
+
+
+def main(
+    lab_short_name: str,
+    days_after_server_stop_till_warning_email: str,
+    days_after_server_stop_till_deletion_email: int,
+    utc_hour_of_day_snapshot_cron_runs: int,
+    cluster_name: str,
+    portal_domain: str,
+    sso_token_secret_name: str,
+    aws_region: str,
+    aws_profile: str = None,
+    ignore_snapshot_requirement: bool = False,
+    verbose: bool = False,
+    dry_run: bool = False,
+) -> None:
+    if aws_profile:
+        session = boto3.Session(region_name=aws_region, profile_name=aws_profile)
+    else:
+        session = boto3.Session(region_name=aws_region)
+
+    try:
+        k8s_config.load_incluster_config()
+    except:
+        k8s_config.load_config()
+    api = k8s_client.CoreV1Api()
+
+    sso_token = SecretProvider(session, f"{sso_token_secret_name}").get()
+
+    inventory = StorageInventory(session.client("ec2"), cluster_name)
+    inventory.refresh()
+
+    delete_volumes(
+        cluster_name=cluster_name,
+        aws_region=aws_region,
+        dry_run=dry_run,
+        aws_profile=aws_profile,
+        ignore_snapshot_requirement=ignore_snapshot_requirement,
+        portal_domain=portal_domain,
+        session=session,
+        api=api,
+        inventory=inventory,
+        sso_token=sso_token,
+    )
+
+    # The snapshot checks look at each PVC's volumes, so they must not see the ones just deleted
+    if not dry_run:
+        inventory.refresh_incremental()
+
+    sm = SnapshotManagement(
+        lab_short_name=lab_short_name,
+        days_after_server_stop_till_warning_email=days_after_server_stop_till_warning_email,
+        days_after_server_stop_till_deletion_email=days_after_server_stop_till_deletion_email,
+        utc_hour_of_day_snapshot_cron_runs=utc_hour_of_day_snapshot_cron_runs,
+        cluster_name=cluster_name,
+        portal_domain=portal_domain,
+        sso_token_secret_name=sso_token_secret_name,
+        aws_region=aws_region,
+        aws_profile=aws_profile,
+        verbose=verbose,
+        dry_run=dry_run,
+        session=session,
+        sso_token=sso_token,
+        inventory=inventory,
+    )
+    sm.main()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check usage status of volumes and snapshots in lab deployment. Delete volumes, send emails and delete snapshots as needed."
+    )
+    parser.add_argument(
+        "--lab-short-name",
+        help="Short name of lab.",
+        dest="lab_short_name",
+        required=True,
+    )
+    parser.add_argument(
+        "--days-after-server-stop-till-warning-email",
+        help="list of days from present till warning emails sent",
+        dest="days_after_server_stop_till_warning_email",
+        required=True,
+    )
+    parser.add_argument(
+        "--days-after-server-stop-till-deletion-email",
+        help="Integer day from present till deletion email sent",
+        dest="days_after_server_stop_till_deletion_email",
+    )
+    parser.add_argument(
+        "--utc-hour-of-day-snapshot-cron-runs",
+        help="Integer hour (UTC) that the shapshot cron runs",
+        dest="utc_hour_of_day_snapshot_cron_runs",
+    )
+    parser.add_argument(
+        "--cluster-name",
+        help="Cluster name (not short lab name)",
+        dest="cluster_name",
+        required=True,
+    )
+    parser.add_argument(
+        "--portal-domain",
+        help="Domain of Portal (including https://)",
+        dest="portal_domain",
+        required=True,
+    )
+    parser.add_argument(
+        "--sso-token-secret-name",
+        help="Secrets Manager name of SSO Token",
+        dest="sso_token_secret_name",
+        required=True,
+    )
+    parser.add_argument(
+        "--region", help="AWS Region name", dest="aws_region", required=True
+    )
+    parser.add_argument(
+        "--profile",
+        help="AWS profile largely for local development",
+        dest="aws_profile",
+        required=False,
+    )
+    parser.add_argument(
+        "--ignore-snapshot-requirement",
+        help="Ignore if backup snapshot exists and possibly delete volume anyway.",
+        dest="ignore_snapshot_requirement",
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "--verbose",
+        help="Show debug messages",
+        dest="verbose",
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "--dry-run",
+        help="Dry run email, removal, and deletions.",
+        dest="dry_run",
+        action="store_true",
+        required=False,
+    )
+    args = vars(parser.parse_args())
+
+    main(**args)
@@ -0,0 +1,84 @@
+"""
+Cached access to Secrets Manager secrets for the crons.
+
+Each cron run is a fresh process, so the cache is kept on disk in `OSL_SECRET_CACHE_DIR` when it is set.
+The CronJobs mount an emptyDir there, which survives container restarts of the same Job pod.
+A retry after a failure therefore reuses the secret fetched by the first attempt.
+
+"""
+
+import hashlib
+import logging
+import os
+import time
+
+import boto3
+
+log = logging.getLogger(__name__)
+
+
+class SecretProvider:
+    def __init__(
+        self,
+        session: boto3.Session,
+        secret_id: str,
+        ttl: int = 3600,
+        cache_dir: str = None,
+    ):
+        self.session = session
+        self.secret_id = secret_id
+        self.ttl = ttl
+
+        cache_dir = cache_dir or os.environ.get("OSL_SECRET_CACHE_DIR", "")
+        if cache_dir and os.path.isdir(cache_dir):
+            file_name = hashlib.sha256(secret_id.encode()).hexdigest()
+            self.cache_path = os.path.join(cache_dir, file_name)
+        else:
+            self.cache_path = None
+
+        self._value = None
+
+    def _load_cached(self) -> str:
+        if self._value is not None:
+            return self._value
+
+        if not self.cache_path:
+            return None
+
+        try:
+            if time.time() - os.path.getmtime(self.cache_path) < self.ttl:
+                with open(self.cache_path, "r") as f:
+                    value = f.read()
+                if value:
+                    log.info(f"Using cached secret '{self.secret_id}'")
+                    return value
+        except OSError:
+            pass
+
+        return None
+
+    def _store(self, value: str) -> None:
+        if not self.cache_path:
+            return
+
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(value)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            log.warning(f"Could not cache secret '{self.secret_id}': {e}")
+
+    def get(self) -> str:
+        value = self._load_cached()
+        if value is None:
+            secrets_manager = self.session.client("secretsmanager")
+            value = secrets_manager.get_secret_value(SecretId=self.secret_id).get(
+                "SecretString", None
+            )
+            if value:
+                self._store(value)
+
+        self._value = value
+        return value
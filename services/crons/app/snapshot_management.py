@@ -9,11 +9,77 @@ import escapism
 
 from opensarlab.auth import encryptedjwt
 
+from inventory import StorageInventory
+from secret_provider import SecretProvider
+
 
 class BadTimeTagsException(Exception):
     """If the time tags are bad or in the wrong order"""
 
 
+def storage_timeline_status(
+    snapshot_times: dict,
+    days_after_server_stop_till_warning_email: list,
+    days_after_server_stop_till_deletion_email: int,
+) -> list:
+    """
+    Given the tag times of a snapshot, return the lifecycle actions due today (UTC).
+    """
+    dt_of_last_server_stop = snapshot_times["dt_of_last_server_stop"]
+    dt_of_volume_deletion = snapshot_times["dt_of_volume_deletion"]
+    dt_of_snapshot_deletion = snapshot_times["dt_of_snapshot_deletion"]
+
+    dt_of_last_server_stop_rounded = dt_of_last_server_stop.date()
+    dt_of_volume_deletion_rounded = dt_of_volume_deletion.date()
+    dt_of_snapshot_deletion_rounded = dt_of_snapshot_deletion.date()
+
+    # The current time is somewhere between the volume getting deleted and when the snapshot is suppose to be deleted.
+    # Since it's assumed that the cron runs once a day, round all times to the day on comparison.
+    utc_day = datetime.now(timezone.utc).date()
+    warning_days_rounded = [
+        dt_of_last_server_stop_rounded + timedelta(days=d)
+        for d in list(days_after_server_stop_till_warning_email)
+    ]
+    email_deletion_day_rounded = dt_of_last_server_stop_rounded + timedelta(
+        days=int(days_after_server_stop_till_deletion_email)
+    )
+
+    # Make sure that dates are in the right order
+    if dt_of_last_server_stop > dt_of_volume_deletion:
+        raise BadTimeTagsException("Volume cannot be deleted before last server stop")
+
+    if dt_of_volume_deletion > dt_of_snapshot_deletion:
+        raise BadTimeTagsException(
+            "Snapshot cannot be deleted before accompying volume"
+        )
+
+    actions = []
+
+    if utc_day <= dt_of_last_server_stop_rounded:
+        actions.append("volume being actively used right now")
+
+    elif utc_day <= dt_of_volume_deletion_rounded:
+        actions.append("timestamp before volume deletion time")
+
+    elif utc_day <= dt_of_snapshot_deletion_rounded:
+        if utc_day in warning_days_rounded:
+            actions.append("send warning email")
+
+        if utc_day == email_deletion_day_rounded:
+            actions.append("send deletion email")
+
+        if utc_day == dt_of_snapshot_deletion_rounded:
+            actions.append("time to delete snapshot")
+
+    elif utc_day > dt_of_snapshot_deletion_rounded:
+        actions.append("snapshot should have already been deleted")
+
+    else:
+        actions.append("why are you seeing this?")
+
+    return actions
+
+
 class SnapshotManagement:
     def __init__(
         self,
@@ -28,7 +94,14 @@ class SnapshotManagement:
         aws_profile: str = None,
         verbose: bool = False,
         dry_run: bool = False,
+        session: boto3.Session = None,
+        sso_token: str = None,
+        inventory: StorageInventory = None,
     ):
+        """
+        `session`, `sso_token` and `inventory` can be passed in by a caller that already has them (see lifecycle_management.py).
+        Otherwise they are created here.
+        """
         if verbose:
             logging_level = logging.DEBUG
         else:
@@ -39,16 +112,17 @@ class SnapshotManagement:
         )
         self.log = logging.getLogger(__name__)
 
-        if aws_profile:
-            session = boto3.Session(region_name=aws_region, profile_name=aws_profile)
-        else:
-            session = boto3.Session(region_name=aws_region)
+        if not session:
+            if aws_profile:
+                session = boto3.Session(
+                    region_name=aws_region, profile_name=aws_profile
+                )
+            else:
+                session = boto3.Session(region_name=aws_region)
 
-        secrets_manager = session.client("secretsmanager")
-        secret_manager_secret = secrets_manager.get_secret_value(
-            SecretId=f"{sso_token_secret_name}"
-        )
-        self.sso_token = secret_manager_secret.get("SecretString", None)
+        if not sso_token:
+            sso_token = SecretProvider(session, f"{sso_token_secret_name}").get()
+        self.sso_token = sso_token
 
         try:
             encryptedjwt.check_sso_token(self.sso_token)
@@ -56,6 +130,7 @@ class SnapshotManagement:
             raise Exception(f"SSO Token has a problem: {e}")
 
         self.ec2 = session.client("ec2")
+        self.inventory = inventory
         self.cluster_name = cluster_name
         self.lab_short_name = lab_short_name
         self.portal_domain = portal_domain
@@ -137,6 +212,9 @@ class SnapshotManagement:
             r.raise_for_status
 
     def get_snapshots(self) -> list:
+        if self.inventory:
+            return list(self.inventory.snapshots)
+
         snap = self.ec2.describe_snapshots(
             Filters=[
                 {
@@ -194,18 +272,23 @@ class SnapshotManagement:
     def does_volume_still_exist(self, snapshot) -> bool:
         pvc_name = self._get_tags(snapshot, "kubernetes.io/created-for/pvc/name")
 
-        vol = self.ec2.describe_volumes(
-            Filters=[
-                {
-                    "Name": "tag:kubernetes.io/created-for/pvc/name",
-                    "Values": [pvc_name],
-                },
-                {
-                    "Name": "tag:kubernetes.io/cluster/{0}".format(self.cluster_name),
-                    "Values": ["owned"],
-                },
-            ]
-        )
+        if self.inventory:
+            vol = {"Volumes": self.inventory.volumes_for_pvc(pvc_name)}
+        else:
+            vol = self.ec2.describe_volumes(
+                Filters=[
+                    {
+                        "Name": "tag:kubernetes.io/created-for/pvc/name",
+                        "Values": [pvc_name],
+                    },
+                    {
+                        "Name": "tag:kubernetes.io/cluster/{0}".format(
+                            self.cluster_name
+                        ),
+                        "Values": ["owned"],
+                    },
+                ]
+            )
 
         if vol["Volumes"]:
             self.log.warning(
@@ -287,62 +370,12 @@ class SnapshotManagement:
         return dts
 
     def storage_timeline_status(self, snapshot_times: dict) -> str:
-        dt_of_last_server_stop = snapshot_times["dt_of_last_server_stop"]
-        dt_of_volume_deletion = snapshot_times["dt_of_volume_deletion"]
-        dt_of_snapshot_deletion = snapshot_times["dt_of_snapshot_deletion"]
-
-        dt_of_last_server_stop_rounded = dt_of_last_server_stop.date()
-        dt_of_volume_deletion_rounded = dt_of_volume_deletion.date()
-        dt_of_snapshot_deletion_rounded = dt_of_snapshot_deletion.date()
-
-        # The current time is somewhere between the volume getting deleted and when the snapshot is suppose to be deleted.
-        # Since it's assumed that the cron runs once a day, round all times to the day on comparison.
-        utc_day = datetime.now(timezone.utc).date()
-        warning_days_rounded = [
-            dt_of_last_server_stop_rounded + timedelta(days=d)
-            for d in list(self.days_after_server_stop_till_warning_email)
-        ]
-        email_deletion_day_rounded = dt_of_last_server_stop_rounded + timedelta(
-            days=int(self.days_after_server_stop_till_deletion_email)
+        return storage_timeline_status(
+            snapshot_times,
+            self.days_after_server_stop_till_warning_email,
+            self.days_after_server_stop_till_deletion_email,
         )
 
-        # Make sure that dates are in the right order
-        if dt_of_last_server_stop > dt_of_volume_deletion:
-            raise BadTimeTagsException(
-                "Volume cannot be deleted before last server stop"
-            )
-
-        if dt_of_volume_deletion > dt_of_snapshot_deletion:
-            raise BadTimeTagsException(
-                "Snapshot cannot be deleted before accompying volume"
-            )
-
-        actions = []
-
-        if utc_day <= dt_of_last_server_stop_rounded:
-            actions.append("volume being actively used right now")
-
-        elif utc_day <= dt_of_volume_deletion_rounded:
-            actions.append("timestamp before volume deletion time")
-
-        elif utc_day <= dt_of_snapshot_deletion_rounded:
-            if utc_day in warning_days_rounded:
-                actions.append("send warning email")
-
-            if utc_day == email_deletion_day_rounded:
-                actions.append("send deletion email")
-
-            if utc_day == dt_of_snapshot_deletion_rounded:
-                actions.append("time to delete snapshot")
-
-        elif utc_day > dt_of_snapshot_deletion_rounded:
-            actions.append("snapshot should have already been deleted")
-
-        else:
-            actions.append("why are you seeing this?")
-
-        return actions
-
     def send_warning_email(self, username: str, snapshot_times: dict) -> None:
         future_snapshot_crontime = f"{snapshot_times['dt_of_snapshot_deletion'].date()} {self.utc_hour_of_day_snapshot_cron_runs}:00 UTC"
         portal_domain_name = self.portal_domain
@@ -17,6 +17,9 @@ from kubernetes.client.rest import ApiException
 
 from opensarlab.auth import encryptedjwt
 
+from inventory import StorageInventory
+from secret_provider import SecretProvider
+
 logging.basicConfig(
     format="%(asctime)s %(levelname)s (%(lineno)d) - %(message)s", level=logging.INFO
 )
@@ -78,41 +81,41 @@ def delete_volumes(
     aws_profile: str,
     ignore_snapshot_requirement: bool,
     portal_domain: str,
+    session: boto3.Session = None,
+    api: k8s_client.CoreV1Api = None,
+    inventory: StorageInventory = None,
+    sso_token: str = None,
 ) -> None:
+    """
+    `session`, `api`, `inventory` and `sso_token` can be passed in by a caller that already has them (see lifecycle_management.py).
+    Otherwise they are created here.
+    """
     errors_found = []
 
-    try:
-        log.info("Checking for expired volumes...")
-
-        try:
-            k8s_config.load_incluster_config()
-        except:
-            k8s_config.load_config()
-        api = k8s_client.CoreV1Api()
-
+    if not session:
         if aws_profile:
             session = boto3.Session(region_name=aws_region, profile_name=aws_profile)
         else:
             session = boto3.Session(region_name=aws_region)
 
-        secrets_manager = session.client("secretsmanager")
-        ec2 = session.client("ec2")
+    try:
+        log.info("Checking for expired volumes...")
+
+        if not api:
+            try:
+                k8s_config.load_incluster_config()
+            except:
+                k8s_config.load_config()
+            api = k8s_client.CoreV1Api()
+
+        if not inventory:
+            inventory = StorageInventory(session.client("ec2"), cluster_name)
+            inventory.refresh()
 
         log.info(f"Searching for volumes in cluster '{cluster_name}' to delete...")
 
         # Volumes currently in use are ignored. Only select available volumes.
-        vols = ec2.describe_volumes(
-            Filters=[
-                {
-                    "Name": "tag:kubernetes.io/cluster/{0}".format(cluster_name),
-                    "Values": ["owned"],
-                },
-                {"Name": "tag:kubernetes.io/created-for/pvc/name", "Values": ["*"]},
-                {"Name": "status", "Values": ["available"]},
-            ]
-        )
-
-        vols = vols["Volumes"]
+        vols = inventory.available_volumes()
 
         log.info(f"Number of vols: {len(vols)}")
         if len(vols) == 0:
@@ -198,23 +201,7 @@ def delete_volumes(
                 )
             else:
                 # Get snapshot
-                snap = ec2.describe_snapshots(
-                    Filters=[
-                        {
-                            "Name": "tag:kubernetes.io/created-for/pvc/name",
-                            "Values": ["{0}".format(pvc_name)],
-                        },
-                        {
-                            "Name": "tag:kubernetes.io/cluster/{0}".format(
-                                cluster_name
-                            ),
-                            "Values": ["owned"],
-                        },
-                        {"Name": "status", "Values": ["completed"]},
-                    ],
-                    OwnerIds=["self"],
-                )
-                snap = snap["Snapshots"]
+                snap = inventory.snapshots_for_pvc(pvc_name)
 
                 has_valid_snapshot = False
                 if len(snap) == 0:
@@ -274,11 +261,12 @@ def delete_volumes(
         errors_found.append({"volume_id": "N/A", "error_msg": str(e)})
 
     if errors_found:
-        _sso_token = secrets_manager.get_secret_value(
-            SecretId=f"sso-token/{aws_region}-{cluster_name}"
-        )
+        if not sso_token:
+            sso_token = SecretProvider(
+                session, f"sso-token/{aws_region}-{cluster_name}"
+            ).get()
         _send_error_report(
-            errors_found, cluster_name, portal_domain, _sso_token, dry_run
+            errors_found, cluster_name, portal_domain, sso_token, dry_run
         )
 
     log.info("Done.")
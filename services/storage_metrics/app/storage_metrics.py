@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+"""
+Prometheus exporter for the lifecycle state of lab user volumes and snapshots.
+
+The EC2 inventory is refreshed in the background on a fixed interval, using the same tag schema as the lifecycle crons.
+Scrapes of /metrics only read the last computed values so Prometheus never triggers EC2 calls.
+
+"""
+
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+import boto3
+from prometheus_client import start_http_server
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily, REGISTRY
+
+from inventory import StorageInventory, PVC_NAME_TAG, get_tag_value
+from snapshot_management import storage_timeline_status, BadTimeTagsException
+
+logging.basicConfig(
+    format="%(asctime)s %(levelname)s (%(lineno)d) - %(message)s", level=logging.INFO
+)
+log = logging.getLogger(__name__)
+
+VOLUME_STATES = [
+    "active",
+    "idle-before-volume-delete",
+    "volume-delete-due",
+    "do-not-delete",
+    "untracked",
+]
+SNAPSHOT_STATES = [
+    "backup",
+    "snapshot-only",
+    "warning-due",
+    "deletion-due",
+    "overdue",
+    "do-not-delete",
+    "untracked",
+]
+
+
+def _str_to_datetime(
+    date_str: str, date_format: str = "%Y-%m-%d %H:%M:%S+00:00"
+) -> datetime:
+    return datetime.strptime(date_str, date_format).replace(tzinfo=timezone.utc)
+
+
+def volume_state(volume: dict, now: datetime) -> str:
+    if volume["State"] == "in-use":
+        return "active"
+
+    if get_tag_value(volume, "do-not-delete"):
+        return "do-not-delete"
+
+    try:
+        dt_of_volume_deletion = _str_to_datetime(
+            get_tag_value(volume, "volume-delete-time")
+        )
+    except ValueError:
+        return "untracked"
+
+    if now <= dt_of_volume_deletion:
+        return "idle-before-volume-delete"
+    return "volume-delete-due"
+
+
+def snapshot_state(
+    snapshot: dict,
+    has_volume: bool,
+    days_after_server_stop_till_warning_email: list,
+    days_after_server_stop_till_deletion_email: int,
+) -> str:
+    if has_volume:
+        return "backup"
+
+    if get_tag_value(snapshot, "do-not-delete"):
+        return "do-not-delete"
+
+    try:
+        snapshot_times = {
+            "dt_of_last_server_stop": _str_to_datetime(
+                get_tag_value(snapshot, "server-stop-time")
+            ),
+            "dt_of_volume_deletion": _str_to_datetime(
+                get_tag_value(snapshot, "volume-delete-time")
+            ),
+            "dt_of_snapshot_deletion": _str_to_datetime(
+                get_tag_value(snapshot, "snapshot-delete-time")
+            ),
+        }
+        actions = storage_timeline_status(
+            snapshot_times,
+            days_after_server_stop_till_warning_email,
+            days_after_server_stop_till_deletion_email,
+        )
+    except (ValueError, BadTimeTagsException):
+        return "untracked"
+
+    if "snapshot should have already been deleted" in actions:
+        return "overdue"
+    if "time to delete snapshot" in actions:
+        return "deletion-due"
+    if "send warning email" in actions:
+        return "warning-due"
+    return "snapshot-only"
+
+
+class StorageStateCollector:
+    """
+    Holds the last computed counts and sizes. `collect()` is called on every scrape and never touches AWS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._gib = {}
+        self._last_refresh = 0.0
+        self._refresh_errors = 0
+
+    def update(self, counts: dict, gib: dict) -> None:
+        with self._lock:
+            self._counts = counts
+            self._gib = gib
+            self._last_refresh = time.time()
+
+    def refresh_failed(self) -> None:
+        with self._lock:
+            self._refresh_errors += 1
+
+    def collect(self):
+        with self._lock:
+            counts = dict(self._counts)
+            gib = dict(self._gib)
+            last_refresh = self._last_refresh
+            refresh_errors = self._refresh_errors
+
+        count_metric = GaugeMetricFamily(
+            "osl_storage_resources",
+            "Number of lab user volumes and snapshots per lifecycle state",
+            labels=["resource", "state"],
+        )
+        gib_metric = GaugeMetricFamily(
+            "osl_storage_gib",
+            "Provisioned GiB of lab user volumes and snapshots per lifecycle state",
+            labels=["resource", "state"],
+        )
+        for resource, states in (
+            ("volume", VOLUME_STATES),
+            ("snapshot", SNAPSHOT_STATES),
+        ):
+            for state in states:
+                count_metric.add_metric(
+                    [resource, state], counts.get((resource, state), 0)
+                )
+                gib_metric.add_metric([resource, state], gib.get((resource, state), 0))
+        yield count_metric
+        yield gib_metric
+
+        yield GaugeMetricFamily(
+            "osl_storage_inventory_last_refresh_timestamp_seconds",
+            "Unix time of the last successful inventory refresh",
+            value=last_refresh,
+        )
+        yield CounterMetricFamily(
+            "osl_storage_inventory_refresh_errors",
+            "Number of failed inventory refreshes",
+            value=refresh_errors,
+        )
+
+
+def summarize(
+    inventory: StorageInventory,
+    days_after_server_stop_till_warning_email: list,
+    days_after_server_stop_till_deletion_email: int,
+) -> tuple:
+    now = datetime.now(timezone.utc)
+    counts = {}
+    gib = {}
+
+    for volume in inventory.volumes:
+        if get_tag_value(volume, PVC_NAME_TAG) == "hub-db-dir":
+            continue
+        key = ("volume", volume_state(volume, now))
+        counts[key] = counts.get(key, 0) + 1
+        gib[key] = gib.get(key, 0) + volume["Size"]
+
+    # Only the latest snapshot of each PVC matters to the lifecycle. Older duplicates are deleted by the snapshot cron.
+    latest_snapshots = {}
+    for snapshot in inventory.snapshots:
+        pvc_name = get_tag_value(snapshot, PVC_NAME_TAG)
+        if pvc_name == "hub-db-dir":
+            continue
+        latest = latest_snapshots.get(pvc_name)
+        if not latest or snapshot["StartTime"] > latest["StartTime"]:
+            latest_snapshots[pvc_name] = snapshot
+
+    for pvc_name, snapshot in latest_snapshots.items():
+        key = (
+            "snapshot",
+            snapshot_state(
+                snapshot,
+                bool(inventory.volumes_for_pvc(pvc_name)),
+                days_after_server_stop_till_warning_email,
+                days_after_server_stop_till_deletion_email,
+            ),
+        )
+        counts[key] = counts.get(key, 0) + 1
+        gib[key] = gib.get(key, 0) + snapshot["VolumeSize"]
+
+    return counts, gib
+
+
+def main(
+    cluster_name: str,
+    aws_region: str,
+    days_after_server_stop_till_warning_email: str,
+    days_after_server_stop_till_deletion_email: int,
+    port: int,
+    refresh_interval: int,
+    full_refresh_interval: int,
+    aws_profile: str = None,
+) -> None:
+    if aws_profile:
+        session = boto3.Session(region_name=aws_region, profile_name=aws_profile)
+    else:
+        session = boto3.Session(region_name=aws_region)
+
+    warning_days = [
+        int(e)
+        for e in days_after_server_stop_till_warning_email.strip("[")
+        .strip("]")
+        .split(",")
+    ]
+
+    inventory = StorageInventory(session.client("ec2"), cluster_name)
+    collector = StorageStateCollector()
+    REGISTRY.register(collector)
+
+    start_http_server(int(port))
+    log.info(f"Serving storage metrics for '{cluster_name}' on port {port}")
+
+    last_full_refresh = None
+    while True:
+        try:
+            if last_full_refresh is None or time.monotonic() - last_full_refresh >= int(
+                full_refresh_interval
+            ):
+                inventory.refresh()
+                last_full_refresh = time.monotonic()
+            else:
+                inventory.refresh_incremental()
+
+            collector.update(
+                *summarize(
+                    inventory,
+                    warning_days,
+                    days_after_server_stop_till_deletion_email,
+                )
+            )
+        except Exception as e:
+            log.error(f"Inventory refresh failed: {e}")
+            collector.refresh_failed()
+
+        time.sleep(int(refresh_interval))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export lifecycle state counts of lab volumes and snapshots as Prometheus metrics."
+    )
+    parser.add_argument(
+        "--cluster-name",
+        help="Cluster name (not short lab name)",
+        dest="cluster_name",
+        required=True,
+    )
+    parser.add_argument(
+        "--region", help="AWS Region name", dest="aws_region", required=True
+    )
+    parser.add_argument(
+        "--days-after-server-stop-till-warning-email",
+        help="list of days from present till warning emails sent",
+        dest="days_after_server_stop_till_warning_email",
+        required=True,
+    )
+    parser.add_argument(
+        "--days-after-server-stop-till-deletion-email",
+        help="Integer day from present till deletion email sent",
+        dest="days_after_server_stop_till_deletion_email",
+        required=True,
+    )
+    parser.add_argument(
+        "--port",
+        help="Port to serve /metrics on",
+        dest="port",
+        default=9100,
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        help="Seconds between incremental inventory refreshes",
+        dest="refresh_interval",
+        default=300,
+    )
+    parser.add_argument(
+        "--full-refresh-interval",
+        help="Seconds between full inventory refreshes",
+        dest="full_refresh_interval",
+        default=3600,
+    )
+    parser.add_argument(
+        "--profile",
+        help="AWS profile largely for local development",
+        dest="aws_profile",
+        required=False,
+    )
+    args = vars(parser.parse_args())
+
+    main(**args)
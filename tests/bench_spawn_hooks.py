@@ -0,0 +1,691 @@
+#!/usr/bin/env python3
+"""
+Benchmark the hub's pre-spawn and post-stop hooks outside the cluster.
+
+The hooks in jupyterhub/config.d are exec'd as the hub would, with `z2jh.get_config` stubbed and the AWS and
+Kubernetes clients swapped for in-process stand-ins. Every fake call sleeps for a lognormal latency around the
+configured median and fails at the configured rate. Failed EC2 calls are retried as botocore does and counted
+as throttles. Failed Kubernetes calls raise a 429.
+
+Scenarios:
+    new_user      No PVC, volume or snapshot. JupyterHub provisions the volume.
+    existing_pvc  The PVC and its volume exist.
+    restore       Only a snapshot exists, so the hook creates and binds a volume from it.
+    storm         --users spawns at once, a third of each of the above.
+
+Each spawn is followed by the post-stop hook. Per-phase latency percentiles come from the hooks' own statsd
+timings. Event-loop blocking is measured by a task that wakes every 5 ms and adds up how late it wakes.
+
+This is meant for local development. It needs the hub image's Python packages (jupyterhub-kubespawner,
+kubernetes, boto3, pyyaml) but no AWS or Kubernetes access.
+
+run:
+    python3 bench_spawn_hooks.py --scenario all --users 50 --ec2-latency 80 --ec2-failure-rate 0.02
+
+Hub settings are changed with --set, e.g. --set SPAWN_ADMISSION_INITIAL=8 --set RESTORE_MODE=csi
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import functools
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+import types
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_D = os.path.join(ROOT_DIR, "jupyterhub", "config.d")
+HOOK_FILES = ["4_post_stop_hook.py", "5_pre_spawn_hook.py"]
+
+sys.path.insert(
+    0, os.path.join(ROOT_DIR, "jupyterhub", "hub", "web", "usr", "local", "lib", "osl")
+)
+
+import botocore.exceptions
+from kubernetes import client as k8s_client
+from kubernetes.client.rest import ApiException
+
+from oslhub import clients, manifests
+from oslhub.spawner import OSLKubeSpawner
+
+CONFIG = {
+    "custom.CLUSTER_NAME": "bench",
+    "custom.AZ_NAME": "us-west-2a",
+    "custom.AWS_REGION": "us-west-2",
+    "custom.COST_TAG_KEY": "osl-billing",
+    "custom.COST_TAG_VALUE": "bench",
+    "custom.DAYS_TILL_VOLUME_DELETION": 10,
+    "custom.DAYS_TILL_SNAPSHOT_DELETION": 30,
+    # As in helm_config.yaml.j2
+    "custom.STOP_TAG_FLUSH_SECONDS": 5,
+}
+
+PVC_NAME_TAG = "kubernetes.io/created-for/pvc/name"
+
+# Swapped for each scenario
+_world = {}
+
+
+class Latency:
+    """
+    Per-call latency and failure injection, shared by the executor threads.
+    """
+
+    def __init__(self, median_ms: float, sigma: float, failure_rate: float, seed: int):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self) -> bool:
+        """
+        Sleep for one call's latency and return whether the call failed.
+        """
+        with self._lock:
+            seconds = self.median_ms / 1000 * math.exp(self._rng.gauss(0, self.sigma))
+            failed = self._rng.random() < self.failure_rate
+        time.sleep(seconds)
+        return failed
+
+
+class FakeEC2:
+    def __init__(self, latency: Latency, volume_ready: float, max_attempts: int = 5):
+        self.latency = latency
+        self.volume_ready = volume_ready
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self.volumes = {}
+        self.snapshots = {}
+        self.calls = collections.Counter()
+
+    def _call(self, operation: str) -> None:
+        self.calls[operation] += 1
+        for _ in range(self.max_attempts):
+            if not self.latency.call():
+                return
+            clients.record_throttle()
+        raise botocore.exceptions.ClientError(
+            {
+                "Error": {
+                    "Code": "RequestLimitExceeded",
+                    "Message": "Request limit exceeded.",
+                }
+            },
+            operation,
+        )
+
+    @staticmethod
+    def _not_found(code: str, operation: str):
+        return botocore.exceptions.ClientError(
+            {"Error": {"Code": code, "Message": ""}}, operation
+        )
+
+    @staticmethod
+    def _matches(resource: dict, filters: list) -> bool:
+        tags = {tag["Key"]: tag["Value"] for tag in resource.get("Tags", [])}
+        for f in filters or []:
+            if f["Name"] == "tag-key":
+                if not any(key in tags for key in f["Values"]):
+                    return False
+            elif f["Name"].startswith("tag:"):
+                if tags.get(f["Name"][4:]) not in f["Values"]:
+                    return False
+        return True
+
+    def add_volume(self, pvc_name: str, size: int = 10) -> str:
+        vol_id = f"vol-{random.getrandbits(64):017x}"[:21]
+        self.volumes[vol_id] = {
+            "VolumeId": vol_id,
+            "Size": size,
+            "AvailabilityZone": CONFIG["custom.AZ_NAME"],
+            "CreateTime": datetime.datetime.now(datetime.timezone.utc),
+            "VolumeType": "gp3",
+            "Encrypted": False,
+            "ReadyAt": 0.0,
+            "Tags": [
+                {"Key": PVC_NAME_TAG, "Value": pvc_name},
+                {
+                    "Key": f"kubernetes.io/cluster/{CONFIG['custom.CLUSTER_NAME']}",
+                    "Value": "owned",
+                },
+            ],
+        }
+        return vol_id
+
+    def add_snapshot(self, pvc_name: str, size: int = 20) -> str:
+        snap_id = f"snap-{random.getrandbits(64):017x}"[:22]
+        self.snapshots[snap_id] = {
+            "SnapshotId": snap_id,
+            "VolumeSize": size,
+            "State": "completed",
+            "StartTime": datetime.datetime.now(datetime.timezone.utc),
+            "Tags": [
+                {"Key": PVC_NAME_TAG, "Value": pvc_name},
+                {
+                    "Key": f"kubernetes.io/cluster/{CONFIG['custom.CLUSTER_NAME']}",
+                    "Value": "owned",
+                },
+            ],
+        }
+        return snap_id
+
+    def _volume_view(self, volume: dict) -> dict:
+        view = {k: v for k, v in volume.items() if k != "ReadyAt"}
+        view["State"] = (
+            "available" if time.monotonic() >= volume["ReadyAt"] else "creating"
+        )
+        return view
+
+    def describe_volumes(self, Filters=None, VolumeIds=None, **kwargs):
+        self._call("describe_volumes")
+        with self._lock:
+            if VolumeIds:
+                missing = [v for v in VolumeIds if v not in self.volumes]
+                if missing:
+                    raise self._not_found("InvalidVolume.NotFound", "DescribeVolumes")
+                volumes = [self.volumes[v] for v in VolumeIds]
+            else:
+                volumes = [
+                    v for v in self.volumes.values() if self._matches(v, Filters)
+                ]
+            return {"Volumes": [self._volume_view(v) for v in volumes]}
+
+    def describe_snapshots(self, Filters=None, SnapshotIds=None, **kwargs):
+        self._call("describe_snapshots")
+        with self._lock:
+            if SnapshotIds:
+                snapshots = [
+                    self.snapshots[s] for s in SnapshotIds if s in self.snapshots
+                ]
+            else:
+                snapshots = [
+                    s for s in self.snapshots.values() if self._matches(s, Filters)
+                ]
+            return {"Snapshots": [dict(s) for s in snapshots]}
+
+    def get_paginator(self, operation_name: str):
+        operation = getattr(self, operation_name)
+        return types.SimpleNamespace(paginate=lambda **kwargs: [operation(**kwargs)])
+
+    def get_waiter(self, waiter_name: str):
+        def wait(VolumeIds):
+            while any(
+                v["State"] != "available"
+                for v in self.describe_volumes(VolumeIds=VolumeIds)["Volumes"]
+            ):
+                time.sleep(0.05)
+
+        return types.SimpleNamespace(wait=wait)
+
+    def create_volume(self, Size, AvailabilityZone, TagSpecifications=None, **kwargs):
+        self._call("create_volume")
+        tags = []
+        for spec in TagSpecifications or []:
+            tags.extend(spec["Tags"])
+        with self._lock:
+            vol_id = f"vol-{random.getrandbits(64):017x}"[:21]
+            self.volumes[vol_id] = {
+                "VolumeId": vol_id,
+                "Size": Size,
+                "AvailabilityZone": AvailabilityZone,
+                "CreateTime": datetime.datetime.now(datetime.timezone.utc),
+                "VolumeType": kwargs.get("VolumeType", "gp2"),
+                "Encrypted": kwargs.get("Encrypted", False),
+                "ReadyAt": time.monotonic() + self.volume_ready,
+                "Tags": tags,
+            }
+            return self._volume_view(self.volumes[vol_id])
+
+    def create_tags(self, Resources, Tags, DryRun=False):
+        self._call("create_tags")
+        with self._lock:
+            for resource_id in Resources:
+                resource = self.volumes.get(resource_id) or self.snapshots.get(
+                    resource_id
+                )
+                if resource is None:
+                    raise self._not_found("InvalidVolume.NotFound", "CreateTags")
+                keys = {tag["Key"] for tag in Tags}
+                resource["Tags"] = [
+                    t for t in resource["Tags"] if t["Key"] not in keys
+                ] + list(Tags)
+
+
+class FakeCoreV1Api:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+
+        self._lock = threading.Lock()
+        self.pvcs = {}
+        self.pvs = {}
+        self.calls = collections.Counter()
+
+    def _call(self, operation: str) -> None:
+        self.calls[operation] += 1
+        if self.latency.call():
+            raise ApiException(status=429, reason="Too Many Requests")
+
+    def add_pvc(self, pvc_name: str, vol_id: str) -> None:
+        self.pvcs[pvc_name] = k8s_client.V1PersistentVolumeClaim(
+            metadata=k8s_client.V1ObjectMeta(name=pvc_name, namespace="jupyter"),
+            spec=k8s_client.V1PersistentVolumeClaimSpec(volume_name=vol_id),
+        )
+
+    def read_namespaced_persistent_volume_claim(self, name, namespace):
+        self._call("read_namespaced_persistent_volume_claim")
+        with self._lock:
+            if name not in self.pvcs:
+                raise ApiException(status=404, reason="Not Found")
+            return self.pvcs[name]
+
+    def create_persistent_volume(self, body):
+        self._call("create_persistent_volume")
+        with self._lock:
+            if body.metadata.name in self.pvs:
+                raise ApiException(status=409, reason="Conflict")
+            self.pvs[body.metadata.name] = body
+
+    def create_namespaced_persistent_volume_claim(self, body, namespace):
+        self._call("create_namespaced_persistent_volume_claim")
+        with self._lock:
+            if body.metadata.name in self.pvcs:
+                raise ApiException(status=409, reason="Conflict")
+            self.pvcs[body.metadata.name] = body
+
+            if body.spec.data_source is not None:
+                # The CSI driver restores the volume and binds the claim straight away
+                size = int(body.spec.resources.requests["storage"][:-2])
+                vol_id = _world["ec2"].add_volume(body.metadata.name, size)
+                pv_name = f"pvc-{vol_id}"
+                self.pvs[pv_name] = k8s_client.V1PersistentVolume(
+                    metadata=k8s_client.V1ObjectMeta(name=pv_name),
+                    spec=k8s_client.V1PersistentVolumeSpec(
+                        csi=k8s_client.V1CSIPersistentVolumeSource(
+                            driver="ebs.csi.aws.com", volume_handle=vol_id
+                        )
+                    ),
+                )
+                body.spec.volume_name = pv_name
+                body.status = k8s_client.V1PersistentVolumeClaimStatus(phase="Bound")
+
+    def read_persistent_volume(self, name):
+        self._call("read_persistent_volume")
+        with self._lock:
+            if name not in self.pvs:
+                raise ApiException(status=404, reason="Not Found")
+            return self.pvs[name]
+
+    def list_persistent_volume(self, label_selector):
+        self._call("list_persistent_volume")
+        key, _, value = label_selector.partition("=")
+        with self._lock:
+            return k8s_client.V1PersistentVolumeList(
+                items=[
+                    pv
+                    for pv in self.pvs.values()
+                    if (pv.metadata.labels or {}).get(key) == value
+                ]
+            )
+
+
+class FakeCustomObjectsApi:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+
+        self._lock = threading.Lock()
+        self.objects = {}
+        self.calls = collections.Counter()
+
+    def _call(self, operation: str) -> None:
+        self.calls[operation] += 1
+        if self.latency.call():
+            raise ApiException(status=429, reason="Too Many Requests")
+
+    def _create(self, plural, body):
+        key = (plural, body["metadata"]["name"])
+        with self._lock:
+            if key in self.objects:
+                raise ApiException(status=409, reason="Conflict")
+            self.objects[key] = body
+
+    def _delete(self, plural, name):
+        with self._lock:
+            if self.objects.pop((plural, name), None) is None:
+                raise ApiException(status=404, reason="Not Found")
+
+    def create_cluster_custom_object(self, group, version, plural, body):
+        self._call("create_cluster_custom_object")
+        self._create(plural, body)
+
+    def create_namespaced_custom_object(self, group, version, namespace, plural, body):
+        self._call("create_namespaced_custom_object")
+        self._create(plural, body)
+
+    def get_namespaced_custom_object(self, group, version, namespace, plural, name):
+        self._call("get_namespaced_custom_object")
+        with self._lock:
+            if (plural, name) not in self.objects:
+                raise ApiException(status=404, reason="Not Found")
+            return self.objects[(plural, name)]
+
+    def list_namespaced_custom_object(self, group, version, namespace, plural):
+        self._call("list_namespaced_custom_object")
+        with self._lock:
+            return {
+                "items": [
+                    body for (kind, _), body in self.objects.items() if kind == plural
+                ]
+            }
+
+    def delete_cluster_custom_object(self, group, version, plural, name):
+        self._call("delete_cluster_custom_object")
+        self._delete(plural, name)
+
+    def delete_namespaced_custom_object(self, group, version, namespace, plural, name):
+        self._call("delete_namespaced_custom_object")
+        self._delete(plural, name)
+
+
+class FakeStatsd:
+    def __init__(self):
+        self.timings = collections.defaultdict(list)
+
+    def timing(self, name: str, ms: float) -> None:
+        self.timings[name].append(ms)
+
+    def gauge(self, name: str, value) -> None:
+        pass
+
+
+class BenchSpawner:
+    """
+    The parts of OSLKubeSpawner the hooks use, without a hub or a Kubernetes client behind it.
+    """
+
+    storage_capacity = "10Gi"
+    storage_volume_type = "gp3"
+    storage_iops = None
+    storage_throughput = None
+    golden_snapshot_id = ""
+    node_selector = {}
+    active = False
+    pending = None
+
+    volume_performance = OSLKubeSpawner.volume_performance
+    mark_home_restored = OSLKubeSpawner.mark_home_restored
+    apply_home_hydration = OSLKubeSpawner.apply_home_hydration
+    _notify_restore_progress = OSLKubeSpawner._notify_restore_progress
+    start_restore_progress = OSLKubeSpawner.start_restore_progress
+    restore_progress = OSLKubeSpawner.restore_progress
+    end_restore_progress = OSLKubeSpawner.end_restore_progress
+
+    def __init__(self, username: str, statsd: FakeStatsd):
+        self.user = types.SimpleNamespace(name=username, settings={"statsd": statsd})
+        self.user_options = {"profile": "bench"}
+        self.pvc_name = f"claim-{username}"
+        self.volume_id = ""
+        self.environment = {}
+        self._restore_events = []
+        self._restore_done = True
+        self._restore_changed = asyncio.Event()
+        self._restore_started = 0.0
+        self._home_restored = False
+
+    async def preload_user_options(self) -> None:
+        pass
+
+    def get_pvc_manifest(self):
+        return k8s_client.V1PersistentVolumeClaim(
+            metadata=k8s_client.V1ObjectMeta(
+                name=self.pvc_name,
+                annotations={"hub.jupyter.org/username": self.user.name},
+                labels={"component": "singleuser-storage"},
+            ),
+            spec=k8s_client.V1PersistentVolumeClaimSpec(
+                storage_class_name="osl-gp3-base-base"
+            ),
+        )
+
+
+class LoopMonitor:
+    """
+    Measure how long the event loop is kept from running other tasks.
+    """
+
+    def __init__(self, interval: float = 0.005, threshold: float = 0.002):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.longest = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - started - self.interval
+            if lag > self.threshold:
+                self.blocked += lag
+                self.longest = max(self.longest, lag)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def load_hooks() -> types.SimpleNamespace:
+    """
+    Exec the hook files into one namespace as z2jh does and return the `c` they configure.
+    """
+    z2jh = types.ModuleType("z2jh")
+    z2jh.get_config = lambda key, default=None: CONFIG.get(key, default)
+    sys.modules["z2jh"] = z2jh
+
+    # The hooks import these at exec time, so they are patched first
+    clients.get_aws_client = lambda service_name, region_name: _world["ec2"]
+    clients.get_core_v1_api = lambda: _world["api"]
+    clients.get_custom_objects_api = lambda: _world["custom_api"]
+    manifests.load_base = functools.partial(
+        manifests.load_base, etc_dir=os.path.join(CONFIG_D, "etc")
+    )
+
+    c = types.SimpleNamespace(
+        Spawner=types.SimpleNamespace(),
+        JupyterHub=types.SimpleNamespace(),
+        KubeSpawner=types.SimpleNamespace(),
+    )
+    namespace = {"c": c, "__name__": "jupyterhub_config"}
+    for file_name in HOOK_FILES:
+        path = os.path.join(CONFIG_D, file_name)
+        with open(path) as f:
+            exec(compile(f.read(), path, "exec"), namespace)
+    _world["hooks"] = namespace
+    return c
+
+
+def seed_user(kind: str, username: str) -> None:
+    pvc_name = f"claim-{username}"
+    if kind == "existing_pvc":
+        vol_id = _world["ec2"].add_volume(pvc_name)
+        _world["api"].add_pvc(pvc_name, vol_id)
+    elif kind == "restore":
+        _world["ec2"].add_snapshot(pvc_name)
+
+
+async def spawn_and_stop(
+    c, username: str, statsd: FakeStatsd, errors: collections.Counter
+):
+    spawner = BenchSpawner(username, statsd)
+    try:
+        await c.Spawner.pre_spawn_hook(spawner)
+        await c.Spawner.post_stop_hook(spawner)
+    except Exception as e:
+        errors[type(e).__name__] += 1
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name: str, spawns: int, wall: float, statsd, monitor, errors):
+    ec2, api = _world["ec2"], _world["api"]
+    print(
+        f"\n== {name}: {spawns} spawns in {wall:.2f}s, {sum(errors.values())} failed {dict(errors) or ''}"
+    )
+    print(f"{'phase (ms)':<44}{'n':>6}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for timing_name in sorted(statsd.timings):
+        values = statsd.timings[timing_name]
+        print(
+            f"{timing_name:<44}{len(values):>6}"
+            + "".join(f"{percentile(values, p):>10.1f}" for p in (50, 90, 99))
+            + f"{max(values):>10.1f}"
+        )
+    print(
+        f"event loop blocked {monitor.blocked * 1000:.1f} ms ({100 * monitor.blocked / max(wall, 1e-9):.2f}% of wall time), "
+        f"longest stall {monitor.longest * 1000:.1f} ms"
+    )
+    print(f"ec2 calls: {dict(ec2.calls)}")
+    print(f"k8s calls: {dict(api.calls + _world['custom_api'].calls)}")
+    print(f"throttles: {clients.throttle_count()}")
+
+
+def new_world(args) -> None:
+    _world["ec2"] = FakeEC2(
+        Latency(args.ec2_latency, args.jitter, args.ec2_failure_rate, args.seed),
+        volume_ready=args.volume_ready,
+    )
+    _world["api"] = FakeCoreV1Api(
+        Latency(args.k8s_latency, args.jitter, args.k8s_failure_rate, args.seed + 1)
+    )
+    _world["custom_api"] = FakeCustomObjectsApi(
+        Latency(args.k8s_latency, args.jitter, args.k8s_failure_rate, args.seed + 2)
+    )
+
+
+async def run_scenario(c, name: str, args) -> None:
+    new_world(args)
+
+    statsd = FakeStatsd()
+    errors = collections.Counter()
+    monitor = LoopMonitor()
+
+    if name == "storm":
+        kinds = ["new_user", "existing_pvc", "restore"]
+        users = [(kinds[i % 3], f"{name}-{i}") for i in range(args.users)]
+    else:
+        users = [(name, f"{name}-{i}") for i in range(args.repeat)]
+
+    for kind, username in users:
+        seed_user(kind, username)
+
+    monitor.start()
+    started = time.perf_counter()
+    if name == "storm":
+        await asyncio.gather(
+            *(spawn_and_stop(c, username, statsd, errors) for _, username in users)
+        )
+    else:
+        for _, username in users:
+            await spawn_and_stop(c, username, statsd, errors)
+    wall = time.perf_counter() - started
+
+    # CSI restores are finished in the background, so wait for them before counting calls
+    await asyncio.gather(*_world["hooks"]["_csi_restores"].values())
+    # So are queued stop tags. The flush runs off the loop, as the flusher thread does.
+    if _world["hooks"]["stop_tag_queue"] is not None:
+        await asyncio.to_thread(_world["hooks"]["stop_tag_queue"].flush)
+    await monitor.stop()
+
+    report(name, len(users), wall, statsd, monitor, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scenario",
+        choices=["new_user", "existing_pvc", "restore", "storm", "all"],
+        default="all",
+    )
+    parser.add_argument(
+        "--users", type=int, default=30, help="Concurrent spawns in the storm"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=10, help="Spawns in each of the other scenarios"
+    )
+    parser.add_argument(
+        "--ec2-latency", type=float, default=60, help="Median EC2 call latency in ms"
+    )
+    parser.add_argument(
+        "--k8s-latency",
+        type=float,
+        default=15,
+        help="Median Kubernetes call latency in ms",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.5, help="Sigma of the lognormal latency"
+    )
+    parser.add_argument("--ec2-failure-rate", type=float, default=0.0)
+    parser.add_argument("--k8s-failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--volume-ready",
+        type=float,
+        default=0.5,
+        help="Seconds until a new volume is available",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Override a hub `custom` setting. The value is parsed as YAML.",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Keep the hooks' INFO and WARNING logs"
+    )
+    args = parser.parse_args()
+
+    for setting in args.set:
+        key, _, value = setting.partition("=")
+        CONFIG[f"custom.{key}"] = yaml.safe_load(value)
+
+    random.seed(args.seed)
+
+    async def _run():
+        # The hooks build their module-level state, such as the admission controller, on the hub's loop. Some
+        # of it, such as the warm pool, calls the fakes straight away.
+        new_world(args)
+        c = load_hooks()
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.ERROR)
+
+        names = (
+            ["new_user", "existing_pvc", "restore", "storm"]
+            if args.scenario == "all"
+            else [args.scenario]
+        )
+        for name in names:
+            await run_scenario(c, name, args)
+
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()